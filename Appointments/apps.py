@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class AppointmentsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'Appointments'
+
+    def ready(self):
+        import Appointments.signals  # Import signals to connect them
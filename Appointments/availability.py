@@ -0,0 +1,83 @@
+from bisect import bisect_left
+from datetime import datetime, time, timedelta
+
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .holds import lapsed_holds
+from .models import TimeSlot
+
+# Upper bound on the requested window so a single call stays cheap
+MAX_WINDOW_DAYS = 62
+
+
+class IntervalSet:
+    """Sorted set of merged, half-open [start, end) intervals"""
+
+    def __init__(self, intervals=()):
+        self._starts = []
+        self._ends = []
+        for start, end in sorted(intervals):
+            if self._ends and start <= self._ends[-1]:
+                self._ends[-1] = max(self._ends[-1], end)
+            else:
+                self._starts.append(start)
+                self._ends.append(end)
+
+    def __len__(self):
+        return len(self._starts)
+
+    def overlaps(self, start, end):
+        """Return True if [start, end) intersects any interval in the set"""
+        # Last interval starting before `end`; intervals are disjoint so their
+        # ends are sorted as well and only this one can reach past `start`.
+        index = bisect_left(self._starts, end) - 1
+        return index >= 0 and self._ends[index] > start
+
+
+def with_free_seat(queryset):
+    """
+    Slots of queryset with a free seat. Seats of lapsed payment holds count
+    as free before expire_holds gets to them, as they do when booking; the
+    holds are only counted for slots whose booked_count says they are full.
+    """
+    lapsed = (
+        lapsed_holds()
+        .filter(timeslot=OuterRef('pk'))
+        .order_by()
+        .values('timeslot')
+        .annotate(count=Count('pk'))
+        .values('count')
+    )
+    return queryset.filter(
+        Q(booked_count__lt=F('capacity'))
+        | Q(booked_count__lt=F('capacity') + Coalesce(Subquery(lapsed), 0))
+    )
+
+
+def available_slots(date_from, date_to, business=None, service=None):
+    """
+    Queryset of the timeslots of a business (or of a single service) with a
+    free seat between date_from and date_to inclusive, ordered by start.
+
+    Only the slot rows inside the window are read, so the cost follows the
+    size of the window rather than the size of the slot history.
+    """
+    if service is not None:
+        business = service.business
+        scope = Q(service=service) | Q(service__isnull=True, business=business)
+    elif business is not None:
+        scope = Q(business=business)
+    else:
+        raise ValueError("A business or a service is required")
+
+    tz = timezone.get_default_timezone()
+    window_start = timezone.make_aware(datetime.combine(date_from, time.min), tz)
+    window_end = timezone.make_aware(datetime.combine(date_to + timedelta(days=1), time.min), tz)
+
+    return with_free_seat(TimeSlot.objects.filter(
+        scope,
+        start_at__gte=window_start,
+        start_at__lt=window_end,
+    )).order_by("start_at", "id")
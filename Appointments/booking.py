@@ -0,0 +1,50 @@
+from django.db import transaction
+from rest_framework import status
+from rest_framework.exceptions import APIException, ValidationError
+
+from .models import Appointment, WaitlistEntry, SlotFull
+from .holds import expire_stale_holds
+from .waitlist import promote_waitlist
+from Payment.models import PaymentIntent
+from Payment.payment_service import PaystackService
+
+
+class SlotUnavailable(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = "This timeslot is already booked."
+    default_code = "slot_unavailable"
+
+
+def book_appointment(serializer, user):
+    """
+    Save a payment-pending appointment from a validated serializer.
+
+    The seat is taken by Appointment.save() with one conditional UPDATE on
+    the timeslot row (booked_count < capacity), so concurrent bookings of a
+    slot cannot oversell it and no count over appointments is needed.
+    Seats that free up while people are waiting go to the waitlist first.
+    The payment intent is created with the booking, so until its link
+    exists the booking keeps its seat and its confirmation email waits.
+    """
+    business = serializer.validated_data['service'].business
+    # Answered from the subaccount cache, not a Paystack call per booking
+    if not PaystackService().is_subaccount_active(business):
+        raise ValidationError("This business cannot accept payments yet")
+
+    timeslot = serializer.validated_data['timeslot']
+    if timeslot.waitlist_entries.filter(status=WaitlistEntry.STATUS_WAITING).exists():
+        if timeslot.booked_count < timeslot.capacity:
+            # The free seats belong to the waiters
+            promote_waitlist(timeslot.id)
+        raise SlotUnavailable("This timeslot has a waitlist; join it to be offered the next free seat.")
+    try:
+        with transaction.atomic():
+            if timeslot.booked_count >= timeslot.capacity:
+                # A lapsed hold on this slot must not block the new booking
+                expire_stale_holds(Appointment.objects.filter(timeslot=timeslot))
+            appointment = serializer.save(user=user, status=Appointment.STATUS_PAYMENT_PENDING)
+            if appointment.pricing is not None:
+                PaymentIntent.objects.create(appointment=appointment, amount=appointment.pricing.price)
+            return appointment
+    except SlotFull:
+        raise SlotUnavailable()
@@ -0,0 +1,70 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from Payment.models import PaymentIntent
+from .models import Appointment, TimeSlot
+
+DEFAULT_HOLD_TTL = timedelta(minutes=15)
+
+
+def hold_cutoff(now=None):
+    """Payment-pending appointments created before this moment have lost their hold"""
+    ttl = getattr(settings, 'APPOINTMENT_HOLD_TTL', DEFAULT_HOLD_TTL)
+    return (now or timezone.now()) - ttl
+
+
+def lapsed_holds(queryset=None):
+    """
+    Payment-pending appointments whose hold has lapsed but which are not
+    failed yet. A booking whose payment link could not be created yet (e.g.
+    accepted while Paystack was down) keeps its seat until the link exists,
+    and its hold then runs from when the link was created.
+    """
+    if queryset is None:
+        queryset = Appointment.objects.all()
+    cutoff = hold_cutoff()
+    intents = PaymentIntent.objects.filter(appointment=OuterRef('pk'))
+    # Subqueries rather than joins, so the result can still be locked
+    return queryset.filter(
+        status=Appointment.STATUS_PAYMENT_PENDING,
+        created_at__lt=cutoff,
+    ).exclude(
+        Exists(intents.filter(authorization_url='')),
+    ).exclude(
+        Exists(intents.filter(transaction__created_at__gte=cutoff)),
+    )
+
+
+def fail_appointments(queryset):
+    """
+    Move the matched appointments to payment failed and give their seats
+    back, set-wise: one SELECT, one UPDATE and one seat UPDATE per distinct
+    number of seats freed on a slot. Rows locked by another transaction are
+    skipped. Returns the number of appointments failed.
+    """
+    with transaction.atomic():
+        failed = list(
+            queryset.filter(status__in=Appointment.BLOCKING_STATUSES)
+            .select_for_update(skip_locked=True)
+            .values_list('id', 'timeslot_id')
+        )
+        if not failed:
+            return 0
+        Appointment.objects.filter(id__in=[appointment_id for appointment_id, _ in failed]).update(
+            status=Appointment.STATUS_PAYMENT_FAILED,
+            updated_at=timezone.now(),
+        )
+        TimeSlot.release_seats([timeslot_id for _, timeslot_id in failed])
+    return len(failed)
+
+
+def expire_stale_holds(queryset=None):
+    """
+    Mark payment-pending appointments whose hold has lapsed as payment failed,
+    found through the (status, created_at) index. Returns the number expired.
+    """
+    return fail_appointments(lapsed_holds(queryset))
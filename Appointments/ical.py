@@ -0,0 +1,102 @@
+import hashlib
+from datetime import timedelta, timezone as dt_timezone
+
+from django.db.models import Count, Max
+from django.utils import timezone
+
+from .models import Appointment
+
+# Past appointments older than this are left out of the feed
+FEED_PAST_DAYS = 90
+
+EVENT_STATUS = {
+    Appointment.STATUS_CONFIRMED: "CONFIRMED",
+    Appointment.STATUS_PENDING: "TENTATIVE",
+    Appointment.STATUS_PAYMENT_PENDING: "TENTATIVE",
+    Appointment.STATUS_CANCELED: "CANCELLED",
+    Appointment.STATUS_PAYMENT_FAILED: "CANCELLED",
+}
+
+
+def feed_appointments(business):
+    """
+    Appointments for a business's services that belong in its calendar feed.
+    Matched through the service, since slots created before slots had an
+    owner have no business.
+    """
+    since = timezone.now() - timedelta(days=FEED_PAST_DAYS)
+    return Appointment.objects.filter(service__business=business, timeslot__start_at__gte=since)
+
+
+def feed_etag(queryset):
+    """
+    ETag for a feed from one aggregate query. The row count is part of it
+    because deleting an appointment does not move the latest updated_at.
+    Events also show their slot's times and their service's name, so edits
+    to those move the ETag too.
+    """
+    state = queryset.aggregate(
+        appointment=Max("updated_at"),
+        timeslot=Max("timeslot__updated_at"),
+        service=Max("service__updated_at"),
+        total=Count("id"),
+    )
+    stamps = [state[key].isoformat() if state[key] else "" for key in ("appointment", "timeslot", "service")]
+    return '"%s"' % hashlib.md5(":".join([*stamps, str(state["total"])]).encode()).hexdigest()
+
+
+def _stamp(value):
+    return value.astimezone(dt_timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+
+
+def _escape(text):
+    return (
+        str(text).replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,").replace("\n", "\\n")
+    )
+
+
+def _line(name, value):
+    """A content line folded at 75 octets as RFC 5545 requires"""
+    data = f"{name}:{value}".encode()
+    parts = []
+    while len(data) > 75:
+        cut = 75 if not parts else 74
+        # Do not split a multi-byte character
+        while cut and (data[cut] & 0xC0) == 0x80:
+            cut -= 1
+        parts.append(data[:cut])
+        data = data[cut:]
+    parts.append(data)
+    return (b"\r\n ".join(parts) + b"\r\n").decode()
+
+
+def render_event(appointment):
+    timeslot = appointment.timeslot
+    customer = appointment.user
+    return "".join([
+        "BEGIN:VEVENT\r\n",
+        _line("UID", f"{appointment.id}@easybook"),
+        _line("DTSTAMP", _stamp(appointment.updated_at)),
+        _line("DTSTART", _stamp(timeslot.start_at)),
+        _line("DTEND", _stamp(timeslot.end_at)),
+        _line("SUMMARY", _escape(f"{appointment.service.name} - {customer.first_name} {customer.last_name}")),
+        _line("DESCRIPTION", _escape(f"Customer: {customer.email}")),
+        _line("STATUS", EVENT_STATUS.get(appointment.status, "TENTATIVE")),
+        "END:VEVENT\r\n",
+    ])
+
+
+def render_calendar(business, queryset):
+    """Yield the calendar piece by piece so large feeds are never held in memory"""
+    name = business.business_name or f"{business.first_name} {business.last_name}"
+    yield "".join([
+        "BEGIN:VCALENDAR\r\n",
+        "VERSION:2.0\r\n",
+        "PRODID:-//EasyBook//Appointments//EN\r\n",
+        "CALSCALE:GREGORIAN\r\n",
+        _line("X-WR-CALNAME", _escape(name)),
+    ])
+    appointments = queryset.select_related("service", "timeslot", "user").order_by("timeslot__start_at")
+    for appointment in appointments.iterator(chunk_size=500):
+        yield render_event(appointment)
+    yield "END:VCALENDAR\r\n"
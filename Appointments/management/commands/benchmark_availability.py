@@ -0,0 +1,91 @@
+import time
+from datetime import datetime, timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from Appointments.availability import available_slots
+from Appointments.models import Appointment, TimeSlot
+from Services.models import Service
+
+# Half-hour slots from 08:00 to 16:00
+SLOTS_PER_DAY = 16
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Time the free-slot query against a synthetic slot history. Everything "
+        "is created in one transaction that is rolled back at the end."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--slots', type=int, default=1_000_000, help="Historical slots to create")
+        parser.add_argument('--businesses', type=int, default=50, help="Businesses the slots are spread over")
+        parser.add_argument('--days', type=int, default=7, help="Days in the queried window")
+        parser.add_argument('--runs', type=int, default=20, help="Timed runs per query")
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.run(options)
+                raise Rollback
+        except Rollback:
+            pass
+
+    def run(self, options):
+        User = get_user_model()
+        today = timezone.localdate()
+        per_business = options['slots'] // options['businesses']
+        history_days = per_business // SLOTS_PER_DAY
+
+        started = time.perf_counter()
+        services = []
+        for index in range(options['businesses']):
+            business = User.objects.create_user(
+                email=f'benchmark-{index}@example.invalid', first_name='Benchmark', last_name=str(index),
+                is_business=True,
+            )
+            services.append(Service.objects.create(business=business, name=f'Benchmark {index}'))
+            slots = []
+            # Mostly history, plus the queried window ahead of today
+            for offset in range(-history_days, options['days']):
+                day = today + timedelta(days=offset)
+                for number in range(SLOTS_PER_DAY):
+                    start = (datetime.min + timedelta(hours=8, minutes=30 * number)).time()
+                    end = (datetime.min + timedelta(hours=8, minutes=30 * (number + 1))).time()
+                    start_at, end_at = TimeSlot.bounds(day, start, end)
+                    slots.append(TimeSlot(
+                        business=business, date=day, start_time=start, end_time=end, start_at=start_at, end_at=end_at,
+                    ))
+            TimeSlot.objects.bulk_create(slots, batch_size=5000)
+        with connection.cursor() as cursor:
+            cursor.execute(f'ANALYZE "{TimeSlot._meta.db_table}"')
+        total = TimeSlot.objects.count()
+        self.stdout.write(f"Created {total} slot(s) in {time.perf_counter() - started:.1f} s")
+
+        service = services[0]
+        window = {'date_from': today, 'date_to': today + timedelta(days=options['days'] - 1)}
+        self.report("available_slots(service), window", options['runs'],
+                    lambda: list(available_slots(service=service, **window)))
+        self.report("available_slots(business), window", options['runs'],
+                    lambda: list(available_slots(business=service.business, **window)))
+        self.report("available_slots(business), first page of 50", options['runs'],
+                    lambda: list(available_slots(business=service.business, **window)[:50]))
+        # The unscoped query AvailableTimeSlotListView used to run
+        self.report("legacy exclude-join over all slots", 1, lambda: list(TimeSlot.objects.exclude(
+            appointments__status__in=[Appointment.STATUS_PENDING, Appointment.STATUS_CONFIRMED],
+        ).values_list('id', flat=True)))
+
+    def report(self, label, runs, query):
+        rows = len(query())  # warm up
+        started = time.perf_counter()
+        for _ in range(runs):
+            query()
+        elapsed = (time.perf_counter() - started) / runs
+        self.stdout.write(f"{label}: {rows} row(s), {elapsed * 1000:.2f} ms per call")
@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from Appointments.holds import expire_stale_holds
+from Appointments.waitlist import promote_stranded_waiters
+
+
+class Command(BaseCommand):
+    help = (
+        "Expire payment-pending appointments whose slot hold has lapsed, then "
+        "promote waiters of upcoming slots with free seats"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help="Keep running, sweeping every --interval seconds")
+        parser.add_argument('--interval', type=int, default=60, help="Seconds between sweeps in --loop mode")
+
+    def handle(self, *args, **options):
+        while True:
+            expired = expire_stale_holds()
+            self.stdout.write(f"Expired {expired} stale hold(s)")
+            # Seats the expiry freed are promoted on commit; this catches the rest
+            promoted = promote_stranded_waiters()
+            self.stdout.write(f"Promoted {len(promoted)} waiter(s)")
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:21
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Appointments', '0006_schedule_rules'),
+        ('Services', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='appointment',
+            constraint=models.UniqueConstraint(condition=models.Q(('status__in', ['P', 'C', 'PP'])), fields=('timeslot',), name='unique_active_appointment_per_timeslot'),
+        ),
+    ]
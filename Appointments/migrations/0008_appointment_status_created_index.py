@@ -0,0 +1,20 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:23
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Appointments', '0007_unique_active_appointment'),
+        ('Services', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['status', 'created_at'], name='appointment_status_created_idx'),
+        ),
+    ]
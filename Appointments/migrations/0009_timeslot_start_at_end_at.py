@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Appointments', '0008_appointment_status_created_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='timeslot',
+            name='end_at',
+            field=models.DateTimeField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='timeslot',
+            name='start_at',
+            field=models.DateTimeField(editable=False, null=True),
+        ),
+    ]
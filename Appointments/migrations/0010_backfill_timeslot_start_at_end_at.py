@@ -0,0 +1,44 @@
+from datetime import datetime, timedelta
+
+from django.db import migrations, transaction
+from django.utils import timezone
+
+CHUNK_SIZE = 2000
+
+
+def backfill_start_end(apps, schema_editor):
+    TimeSlot = apps.get_model('Appointments', 'TimeSlot')
+    tz = timezone.get_default_timezone()
+    last_id = 0
+    while True:
+        # Each chunk commits on its own so large tables are not locked at once
+        with transaction.atomic():
+            chunk = list(
+                TimeSlot.objects.filter(id__gt=last_id, start_at__isnull=True)
+                .order_by('id')
+                .only('id', 'date', 'start_time', 'end_time')[:CHUNK_SIZE]
+            )
+            if not chunk:
+                break
+            for slot in chunk:
+                start = datetime.combine(slot.date, slot.start_time)
+                end = datetime.combine(slot.date, slot.end_time)
+                if end <= start:
+                    end += timedelta(days=1)
+                slot.start_at = timezone.make_aware(start, tz)
+                slot.end_at = timezone.make_aware(end, tz)
+            TimeSlot.objects.bulk_update(chunk, ['start_at', 'end_at'])
+        last_id = chunk[-1].id
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('Appointments', '0009_timeslot_start_at_end_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_start_end, migrations.RunPython.noop),
+    ]
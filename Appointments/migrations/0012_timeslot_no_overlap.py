@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:26
+
+import Appointments.models
+import django.contrib.postgres.constraints
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Appointments', '0011_timeslot_start_at_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='timeslot',
+            name='end_at',
+            field=models.DateTimeField(editable=False),
+        ),
+        migrations.AlterField(
+            model_name='timeslot',
+            name='start_at',
+            field=models.DateTimeField(editable=False),
+        ),
+        migrations.AddConstraint(
+            model_name='timeslot',
+            constraint=django.contrib.postgres.constraints.ExclusionConstraint(condition=models.Q(('business__isnull', False)), expressions=[(Appointments.models.Int8Range('business', 'business', models.Value('[]')), '&&'), (Appointments.models.TsTzRange('start_at', 'end_at'), '&&')], name='timeslot_no_overlap_per_business'),
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:30
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+
+def backfill_booked_count(apps, schema_editor):
+    TimeSlot = apps.get_model('Appointments', 'TimeSlot')
+    Appointment = apps.get_model('Appointments', 'Appointment')
+    active = (
+        Appointment.objects.filter(timeslot=OuterRef('pk'), status__in=['P', 'C', 'PP'])
+        .order_by()
+        .values('timeslot')
+        .annotate(total=Count('id'))
+        .values('total')
+    )
+    # One set-based UPDATE; slots double-booked in the past get their
+    # capacity raised so the new check constraint holds
+    TimeSlot.objects.update(booked_count=Coalesce(Subquery(active), 0))
+    TimeSlot.objects.filter(booked_count__gt=models.F('capacity')).update(
+        capacity=Greatest('capacity', 'booked_count')
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Appointments', '0012_timeslot_no_overlap'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='appointment',
+            name='unique_active_appointment_per_timeslot',
+        ),
+        migrations.AddField(
+            model_name='schedulerule',
+            name='capacity',
+            field=models.PositiveIntegerField(default=1, help_text='Seats per generated slot'),
+        ),
+        migrations.AddField(
+            model_name='timeslot',
+            name='booked_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='timeslot',
+            name='capacity',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.RunPython(backfill_booked_count, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='timeslot',
+            constraint=models.CheckConstraint(condition=models.Q(('booked_count__lte', models.F('capacity'))), name='timeslot_booked_within_capacity'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:31
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Appointments', '0013_timeslot_capacity'),
+        ('Services', '0002_service_service_created_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WaitlistEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('W', 'Waiting'), ('P', 'Promoted'), ('X', 'Canceled')], default='W', max_length=1)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('appointment', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='waitlist_entry', to='Appointments.appointment')),
+                ('pricing', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='Services.pricing')),
+                ('service', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='Services.service')),
+                ('timeslot', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='waitlist_entries', to='Appointments.timeslot')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='waitlist_entries', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['timeslot', 'status', 'created_at'], name='waitlist_queue_idx')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('status', 'W')), fields=('user', 'timeslot'), name='unique_waiting_entry_per_user_timeslot')],
+            },
+        ),
+    ]
@@ -3,19 +3,133 @@ from django.db import models
 # Create your models here.
 
 import uuid
-from django.db import models
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+from django.db import models, transaction
 from django.conf import settings
+from django.dispatch import Signal
+from django.contrib.postgres.constraints import ExclusionConstraint
+from django.contrib.postgres.fields import BigIntegerRangeField, DateTimeRangeField, RangeOperators
+from django.utils import timezone
 from Services.models import Service  # Import the Services model
 
+# Sent with timeslot_ids whenever seats are given back on those timeslots
+seats_released = Signal()
+
+
+class SlotFull(Exception):
+    """Raised when an appointment needs a seat on a timeslot that has none left"""
+
+
+class TsTzRange(models.Func):
+    function = "TSTZRANGE"
+    output_field = DateTimeRangeField()
+
+
+class Int8Range(models.Func):
+    function = "INT8RANGE"
+    output_field = BigIntegerRangeField()
+
+
 class TimeSlot(models.Model):
     id = models.AutoField(primary_key=True)
+    business = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="timeslots", null=True, blank=True)
+    # A slot without a service can be booked for any service of its business
+    service = models.ForeignKey(Service, on_delete=models.CASCADE, related_name="timeslots", null=True, blank=True)
     date = models.DateField()
     start_time = models.TimeField()
     end_time = models.TimeField()
+    # Derived from date/start_time/end_time on save so range queries and
+    # ordering can use a single index
+    start_at = models.DateTimeField(editable=False)
+    end_at = models.DateTimeField(editable=False)
+    capacity = models.PositiveIntegerField(default=1)
+    # Seats held by appointments in a blocking status; only ever changed by
+    # the conditional UPDATEs in reserve_seat/release_seats
+    booked_count = models.PositiveIntegerField(default=0, editable=False)
+    # Not moved by seat counting, which never goes through save()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["start_at", "end_at"], name="timeslot_start_end_idx"),
+            models.Index(fields=["business", "start_at"], name="timeslot_business_start_idx"),
+            models.Index(fields=["service", "start_at"], name="timeslot_service_start_idx"),
+        ]
+        constraints = [
+            # A business cannot own overlapping slots. The owner is compared as a
+            # single-point int8range so the GiST index needs no btree_gist extension.
+            ExclusionConstraint(
+                name="timeslot_no_overlap_per_business",
+                expressions=[
+                    (Int8Range("business", "business", models.Value("[]")), RangeOperators.OVERLAPS),
+                    (TsTzRange("start_at", "end_at"), RangeOperators.OVERLAPS),
+                ],
+                condition=models.Q(business__isnull=False),
+            ),
+            models.CheckConstraint(
+                condition=models.Q(booked_count__lte=models.F("capacity")),
+                name="timeslot_booked_within_capacity",
+            ),
+        ]
 
     def __str__(self):
         return f"{self.date} {self.start_time}-{self.end_time}"
 
+    @staticmethod
+    def bounds(date, start_time, end_time):
+        """Timezone-aware start and end datetimes for a slot's date and times"""
+        tz = timezone.get_default_timezone()
+        start = datetime.combine(date, start_time)
+        end = datetime.combine(date, end_time)
+        if end <= start:
+            # Slot runs past midnight
+            end += timedelta(days=1)
+        return timezone.make_aware(start, tz), timezone.make_aware(end, tz)
+
+    def offers(self, service):
+        """
+        Whether the slot can be booked for a service: it must belong to the
+        service's business and be open to that service. Slots created before
+        slots had an owner belong to no business and stay open to all.
+        """
+        if self.business_id is not None and self.business_id != service.business_id:
+            return False
+        return self.service_id in (None, service.id)
+
+    def save(self, *args, **kwargs):
+        self.start_at, self.end_at = self.bounds(self.date, self.start_time, self.end_time)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None:
+            kwargs["update_fields"] = {*update_fields, "start_at", "end_at", "updated_at"}
+        elif not self._state.adding:
+            # Never write back a possibly stale in-memory booked_count
+            kwargs["update_fields"] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != "booked_count"
+            ]
+        super().save(*args, **kwargs)
+
+    @classmethod
+    def reserve_seat(cls, timeslot_id):
+        """Take one seat with a single conditional UPDATE; False when the slot is full"""
+        return cls.objects.filter(
+            pk=timeslot_id,
+            booked_count__lt=models.F("capacity"),
+        ).update(booked_count=models.F("booked_count") + 1) == 1
+
+    @classmethod
+    def release_seats(cls, timeslot_ids):
+        """Give back one seat for every occurrence of a timeslot id"""
+        counts = Counter(timeslot_ids)
+        ids_by_count = defaultdict(list)
+        for timeslot_id, count in counts.items():
+            ids_by_count[count].append(timeslot_id)
+        for count, ids in ids_by_count.items():
+            cls.objects.filter(pk__in=ids).update(booked_count=models.F("booked_count") - count)
+        if counts:
+            seats_released.send(sender=cls, timeslot_ids=list(counts))
+
 class Appointment(models.Model):
     STATUS_PENDING = "P"
     STATUS_CONFIRMED = "C"
@@ -31,6 +145,9 @@ class Appointment(models.Model):
         (STATUS_PAYMENT_FAILED, "Payment Failed"),
     ]
 
+    # Statuses that keep the timeslot occupied; an unpaid booking holds it too
+    BLOCKING_STATUSES = [STATUS_PENDING, STATUS_CONFIRMED, STATUS_PAYMENT_PENDING]
+
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="appointments")
     timeslot = models.ForeignKey(TimeSlot, on_delete=models.CASCADE, related_name="appointments")
@@ -40,5 +157,134 @@ class Appointment(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # Used by the hold sweeper to find stale payment-pending bookings
+            models.Index(fields=["status", "created_at"], name="appointment_status_created_idx"),
+        ]
+
     def __str__(self):
         return f"Appointment for {self.user} on {self.timeslot}"
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember which seat the stored row holds so save() can move it
+        if "status" in field_names and "timeslot_id" in field_names:
+            instance._stored_seat = instance._seat()
+        return instance
+
+    def _seat(self):
+        """Timeslot id whose seat this appointment occupies, if any"""
+        return self.timeslot_id if self.status in self.BLOCKING_STATUSES else None
+
+    def save(self, *args, **kwargs):
+        if self._state.adding:
+            stored_seat = None
+        elif hasattr(self, "_stored_seat"):
+            stored_seat = self._stored_seat
+        else:
+            stored = Appointment.objects.filter(pk=self.pk).values_list("status", "timeslot_id").first()
+            stored_seat = stored[1] if stored and stored[0] in self.BLOCKING_STATUSES else None
+
+        seat = self._seat()
+        with transaction.atomic():
+            if seat != stored_seat:
+                if seat is not None and not TimeSlot.reserve_seat(seat):
+                    raise SlotFull()
+                if stored_seat is not None:
+                    TimeSlot.release_seats([stored_seat])
+            super().save(*args, **kwargs)
+        self._stored_seat = seat
+
+
+class ScheduleRule(models.Model):
+    """Weekly opening hours of a business, used to generate timeslots"""
+    WEEKDAY_CHOICES = [
+        (0, "Monday"),
+        (1, "Tuesday"),
+        (2, "Wednesday"),
+        (3, "Thursday"),
+        (4, "Friday"),
+        (5, "Saturday"),
+        (6, "Sunday"),
+    ]
+
+    business = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="schedule_rules")
+    service = models.ForeignKey(Service, on_delete=models.CASCADE, related_name="schedule_rules", null=True, blank=True)
+    weekday = models.PositiveSmallIntegerField(choices=WEEKDAY_CHOICES)
+    start_time = models.TimeField()
+    end_time = models.TimeField()
+    slot_length = models.PositiveIntegerField(help_text="Slot length in minutes")
+    capacity = models.PositiveIntegerField(default=1, help_text="Seats per generated slot")
+    is_active = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.get_weekday_display()} {self.start_time}-{self.end_time} ({self.slot_length} min)"
+
+
+class ScheduleBreak(models.Model):
+    rule = models.ForeignKey(ScheduleRule, on_delete=models.CASCADE, related_name="breaks")
+    start_time = models.TimeField()
+    end_time = models.TimeField()
+
+    def __str__(self):
+        return f"Break {self.start_time}-{self.end_time}"
+
+
+class ScheduleException(models.Model):
+    """A date on which the weekly schedule does not apply"""
+    business = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="schedule_exceptions")
+    date = models.DateField()
+    # Closed for the whole day when no times are given
+    start_time = models.TimeField(null=True, blank=True)
+    end_time = models.TimeField(null=True, blank=True)
+    reason = models.CharField(max_length=255, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["business", "date"], name="schedule_exception_date_idx"),
+        ]
+
+    def __str__(self):
+        return f"Exception on {self.date}"
+
+
+
+class WaitlistEntry(models.Model):
+    """A customer queued for a seat on a full timeslot"""
+    STATUS_WAITING = "W"
+    STATUS_PROMOTED = "P"
+    STATUS_CANCELED = "X"
+
+    STATUS_CHOICES = [
+        (STATUS_WAITING, "Waiting"),
+        (STATUS_PROMOTED, "Promoted"),
+        (STATUS_CANCELED, "Canceled"),
+    ]
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="waitlist_entries")
+    timeslot = models.ForeignKey(TimeSlot, on_delete=models.CASCADE, related_name="waitlist_entries")
+    service = models.ForeignKey(Service, on_delete=models.CASCADE)
+    pricing = models.ForeignKey("Services.Pricing", on_delete=models.CASCADE)
+    status = models.CharField(max_length=1, choices=STATUS_CHOICES, default=STATUS_WAITING)
+    # The appointment created when this entry was promoted
+    appointment = models.OneToOneField(Appointment, on_delete=models.SET_NULL, null=True, blank=True, related_name="waitlist_entry")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # Next waiter for a slot, first come first served
+            models.Index(fields=["timeslot", "status", "created_at"], name="waitlist_queue_idx"),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "timeslot"],
+                condition=models.Q(status="W"),
+                name="unique_waiting_entry_per_user_timeslot",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.user} waiting for {self.timeslot}"
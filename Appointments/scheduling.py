@@ -0,0 +1,174 @@
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+
+from bisect import bisect_left
+
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError, transaction
+from django.db.backends.postgresql.psycopg_any import DateTimeTZRange, NumericRange
+from django.db.models import Value
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from .models import TimeSlot, ScheduleRule, ScheduleException, TsTzRange, Int8Range
+from .availability import IntervalSet
+
+BATCH_SIZE = 1000
+MAX_RANGE_DAYS = 366
+
+
+class ScheduleConflict(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = "Timeslots overlapping this range were created concurrently; please retry."
+    default_code = "schedule_conflict"
+
+
+def overlapping_slots(business, start_at, end_at):
+    """
+    Slots of a business intersecting [start_at, end_at). The expressions
+    mirror the overlap exclusion constraint so its GiST index serves the lookup.
+    """
+    return TimeSlot.objects.annotate(
+        owner=Int8Range('business', 'business', Value('[]')),
+        span=TsTzRange('start_at', 'end_at'),
+    ).filter(
+        business__isnull=False,
+        owner__overlap=NumericRange(business.pk, business.pk, '[]'),
+        span__overlap=DateTimeTZRange(start_at, end_at),
+    )
+
+
+def find_conflicts(business, spans):
+    """
+    Check (start_at, end_at) spans against each other and against the
+    business's existing slots, reading the existing slots in one query.
+    Returns one entry per conflicting span, identified by its index.
+    """
+    if not spans:
+        return []
+
+    existing = list(
+        overlapping_slots(
+            business,
+            min(start for start, _ in spans),
+            max(end for _, end in spans),
+        ).order_by('start_at').values_list('id', 'start_at', 'end_at')
+    )
+    # Existing slots never overlap each other, so their ends are sorted too
+    existing_starts = [start for _, start, _ in existing]
+
+    conflicts = []
+    latest = None  # (end, index) of the furthest-reaching span seen so far
+    for index in sorted(range(len(spans)), key=lambda i: spans[i]):
+        start, end = spans[index]
+        clashes = []
+        position = bisect_left(existing_starts, end) - 1
+        while position >= 0 and existing[position][2] > start:
+            clashes.append(existing[position][0])
+            position -= 1
+        if clashes:
+            conflicts.append({
+                'index': index,
+                'detail': f"Overlaps existing timeslot(s) {', '.join(map(str, sorted(clashes)))}",
+            })
+        elif latest is not None and latest[0] > start:
+            conflicts.append({
+                'index': index,
+                'detail': f"Overlaps timeslot at index {latest[1]} of this request",
+            })
+        if latest is None or end > latest[0]:
+            latest = (end, index)
+
+    return sorted(conflicts, key=lambda conflict: conflict['index'])
+
+
+def _overlaps(start, end, windows):
+    return any(start < window_end and window_start < end for window_start, window_end in windows)
+
+
+def generate_slots(rules, exceptions, date_from, date_to):
+    """Yield (date, start_time, end_time, rule) for every slot the rules describe"""
+    rules_by_weekday = defaultdict(list)
+    for rule in rules:
+        rules_by_weekday[rule.weekday].append(rule)
+
+    closed = defaultdict(list)
+    for exception in exceptions:
+        closed[exception.date].append((exception.start_time, exception.end_time))
+
+    day = date_from
+    while day <= date_to:
+        windows = closed.get(day, [])
+        # An exception without times closes the whole day
+        if not any(start is None or end is None for start, end in windows):
+            for rule in rules_by_weekday.get(day.weekday(), ()):
+                blocked = windows + [(b.start_time, b.end_time) for b in rule.breaks.all()]
+                step = timedelta(minutes=rule.slot_length)
+                start = datetime.combine(day, rule.start_time)
+                close = datetime.combine(day, rule.end_time)
+                while start + step <= close:
+                    end = start + step
+                    if not _overlaps(start.time(), end.time(), blocked):
+                        yield day, start.time(), end.time(), rule
+                    start = end
+        day += timedelta(days=1)
+
+
+def materialize_slots(business, date_from, date_to, service=None):
+    """
+    Create the timeslots described by a business's schedule rules between
+    date_from and date_to inclusive, skipping any slot that would overlap
+    one that already exists. Returns the number of slots created. Raises
+    ScheduleConflict when a slot created meanwhile by other means overlaps
+    one of the new slots.
+    """
+    rules = ScheduleRule.objects.filter(business=business, is_active=True).prefetch_related('breaks')
+    if service is not None:
+        rules = rules.filter(service=service)
+    exceptions = ScheduleException.objects.filter(business=business, date__range=(date_from, date_to))
+
+    tz = timezone.get_default_timezone()
+    range_start = timezone.make_aware(datetime.combine(date_from, time.min), tz)
+    range_end = timezone.make_aware(datetime.combine(date_to + timedelta(days=1), time.min), tz)
+
+    candidates = []
+    for day, start_time, end_time, rule in generate_slots(rules, exceptions, date_from, date_to):
+        # bulk_create skips TimeSlot.save(), so derive start_at/end_at here
+        start_at, end_at = TimeSlot.bounds(day, start_time, end_time)
+        candidates.append(TimeSlot(
+            business=business,
+            service_id=rule.service_id,
+            capacity=rule.capacity,
+            date=day,
+            start_time=start_time,
+            end_time=end_time,
+            start_at=start_at,
+            end_at=end_at,
+        ))
+    candidates.sort(key=lambda slot: slot.start_at)
+
+    with transaction.atomic():
+        # Concurrent generations for one business take turns, so neither
+        # inserts a slot the other's overlap check could not see
+        get_user_model().objects.select_for_update().only('pk').get(pk=business.pk)
+        existing = IntervalSet(
+            overlapping_slots(business, range_start, range_end).values_list('start_at', 'end_at')
+        )
+
+        new_slots = []
+        for slot in candidates:
+            if existing.overlaps(slot.start_at, slot.end_at):
+                continue
+            # Rules with overlapping hours must not produce overlapping slots
+            if new_slots and new_slots[-1].end_at > slot.start_at:
+                continue
+            new_slots.append(slot)
+
+        try:
+            TimeSlot.objects.bulk_create(new_slots, batch_size=BATCH_SIZE)
+        except IntegrityError:
+            # A slot created directly, without the lock, took the time
+            raise ScheduleConflict()
+
+    return len(new_slots)
@@ -1,6 +1,10 @@
+from datetime import timedelta
+from django.contrib.auth import get_user_model
 from rest_framework import serializers
-from .models import TimeSlot, Appointment
-from Services.models import Pricing
+from .models import TimeSlot, Appointment, ScheduleRule, ScheduleBreak, ScheduleException, WaitlistEntry
+from .availability import MAX_WINDOW_DAYS
+from .scheduling import MAX_RANGE_DAYS, overlapping_slots
+from Services.models import Pricing, Service
 
 class PricingSerializer(serializers.ModelSerializer):
     class Meta:
@@ -12,6 +16,128 @@ class TimeSlotSerializer(serializers.ModelSerializer):
     class Meta:
         model = TimeSlot
         fields = '__all__'
+        read_only_fields = ['business']
+
+    def validate_service(self, value):
+        request = self.context.get('request')
+        if value and request and value.business != request.user:
+            raise serializers.ValidationError("You can only create timeslots for your own services")
+        return value
+
+    def validate_capacity(self, value):
+        if value < 1:
+            raise serializers.ValidationError("Capacity must be at least 1")
+        if self.instance and value < self.instance.booked_count:
+            raise serializers.ValidationError("Capacity cannot be lower than the seats already booked")
+        return value
+
+    def validate(self, data):
+        # A partial update keeps the fields it does not send
+        date, start_time, end_time = (
+            data.get(field, getattr(self.instance, field, None)) for field in ('date', 'start_time', 'end_time')
+        )
+        if start_time == end_time:
+            raise serializers.ValidationError("Timeslot must end after it starts")
+        request = self.context.get('request')
+        # Bulk requests are checked in a single pass by the view instead
+        if request and not isinstance(self.parent, serializers.ListSerializer):
+            start_at, end_at = TimeSlot.bounds(date, start_time, end_time)
+            overlapping = overlapping_slots(request.user, start_at, end_at)
+            if self.instance is not None:
+                overlapping = overlapping.exclude(pk=self.instance.pk)
+            if overlapping.exists():
+                raise serializers.ValidationError("This timeslot overlaps an existing timeslot")
+        return data
+
+class AvailabilityQuerySerializer(serializers.Serializer):
+    date_from = serializers.DateField()
+    date_to = serializers.DateField()
+    business = serializers.PrimaryKeyRelatedField(
+        queryset=get_user_model().objects.filter(is_business=True), required=False
+    )
+    service = serializers.PrimaryKeyRelatedField(
+        queryset=Service.objects.select_related('business'), required=False
+    )
+
+    def validate(self, data):
+        if not data.get('business') and not data.get('service'):
+            raise serializers.ValidationError("Either business or service is required")
+        if data['date_to'] < data['date_from']:
+            raise serializers.ValidationError("date_to must not be before date_from")
+        if data['date_to'] - data['date_from'] > timedelta(days=MAX_WINDOW_DAYS):
+            raise serializers.ValidationError(f"Date range cannot exceed {MAX_WINDOW_DAYS} days")
+        return data
+
+class ScheduleBreakSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ScheduleBreak
+        fields = ['id', 'start_time', 'end_time']
+        read_only_fields = ['id']
+
+    def validate(self, data):
+        if data['end_time'] <= data['start_time']:
+            raise serializers.ValidationError("Break must end after it starts")
+        return data
+
+class ScheduleRuleSerializer(serializers.ModelSerializer):
+    breaks = ScheduleBreakSerializer(many=True, required=False)
+
+    class Meta:
+        model = ScheduleRule
+        fields = ['id', 'service', 'weekday', 'start_time', 'end_time', 'slot_length', 'capacity', 'breaks', 'is_active', 'created_at']
+        read_only_fields = ['id', 'created_at']
+
+    def validate_service(self, value):
+        if value and value.business != self.context['request'].user:
+            raise serializers.ValidationError("You can only create schedules for your own services")
+        return value
+
+    def validate_slot_length(self, value):
+        if value < 5:
+            raise serializers.ValidationError("Slot length must be at least 5 minutes")
+        return value
+
+    def validate(self, data):
+        if data['end_time'] <= data['start_time']:
+            raise serializers.ValidationError("Schedule must end after it starts")
+        return data
+
+    def create(self, validated_data):
+        breaks = validated_data.pop('breaks', [])
+        rule = ScheduleRule.objects.create(**validated_data)
+        ScheduleBreak.objects.bulk_create(ScheduleBreak(rule=rule, **item) for item in breaks)
+        return rule
+
+class ScheduleExceptionSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ScheduleException
+        fields = ['id', 'date', 'start_time', 'end_time', 'reason']
+        read_only_fields = ['id']
+
+    def validate(self, data):
+        start_time, end_time = data.get('start_time'), data.get('end_time')
+        if (start_time is None) != (end_time is None):
+            raise serializers.ValidationError("Provide both start_time and end_time, or neither to close the whole day")
+        if start_time is not None and end_time <= start_time:
+            raise serializers.ValidationError("Exception must end after it starts")
+        return data
+
+class SlotGenerationSerializer(serializers.Serializer):
+    date_from = serializers.DateField()
+    date_to = serializers.DateField()
+    service = serializers.PrimaryKeyRelatedField(queryset=Service.objects.all(), required=False)
+
+    def validate_service(self, value):
+        if value.business != self.context['request'].user:
+            raise serializers.ValidationError("You can only generate timeslots for your own services")
+        return value
+
+    def validate(self, data):
+        if data['date_to'] < data['date_from']:
+            raise serializers.ValidationError("date_to must not be before date_from")
+        if data['date_to'] - data['date_from'] > timedelta(days=MAX_RANGE_DAYS):
+            raise serializers.ValidationError(f"Date range cannot exceed {MAX_RANGE_DAYS} days")
+        return data
 
 class AppointmentCreateSerializer(serializers.ModelSerializer):
     pricing_id = serializers.IntegerField(write_only=True)
@@ -30,6 +156,10 @@ class AppointmentCreateSerializer(serializers.ModelSerializer):
         
         if not pricing:
             raise serializers.ValidationError("Invalid pricing option for the selected service")
+
+        # Payouts and the split go to the service's business, so the slot must be theirs
+        if not data['timeslot'].offers(data['service']):
+            raise serializers.ValidationError("This timeslot is not offered for the selected service")
         
         return data
 
@@ -55,3 +185,24 @@ class AppointmentSerializer(serializers.ModelSerializer):
         model = Appointment
         fields = '__all__'
         read_only_fields = ['user', 'created_at', 'updated_at']
+
+
+class WaitlistEntrySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = WaitlistEntry
+        fields = ['id', 'timeslot', 'service', 'pricing', 'status', 'appointment', 'created_at']
+        read_only_fields = ['id', 'status', 'appointment', 'created_at']
+        validators = []
+
+    def validate(self, data):
+        timeslot, service, pricing = data['timeslot'], data['service'], data['pricing']
+        if pricing.service_id != service.id:
+            raise serializers.ValidationError("Invalid pricing option for the selected service")
+        if not timeslot.offers(service):
+            raise serializers.ValidationError("This timeslot is not offered for the selected service")
+        if timeslot.booked_count < timeslot.capacity and not timeslot.waitlist_entries.filter(
+                status=WaitlistEntry.STATUS_WAITING).exists():
+            raise serializers.ValidationError("This timeslot has free seats; book it directly")
+        if timeslot.waitlist_entries.filter(user=self.context['request'].user, status=WaitlistEntry.STATUS_WAITING).exists():
+            raise serializers.ValidationError("You are already on the waitlist for this timeslot")
+        return data
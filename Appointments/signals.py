@@ -0,0 +1,23 @@
+from django.db import transaction
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from .models import Appointment, TimeSlot, seats_released
+from .waitlist import promote_waitlist
+
+
+@receiver(post_delete, sender=Appointment)
+def release_seat_on_delete(sender, instance, **kwargs):
+    """Free the seat held by a deleted appointment"""
+    seat = instance._seat()
+    if seat is not None:
+        TimeSlot.release_seats([seat])
+
+
+@receiver(seats_released, sender=TimeSlot)
+def promote_waiters(sender, timeslot_ids, **kwargs):
+    """Offer freed seats to the waitlist once the release is committed"""
+    def promote():
+        for timeslot_id in timeslot_ids:
+            promote_waitlist(timeslot_id)
+    transaction.on_commit(promote)
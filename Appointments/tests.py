@@ -1,3 +1,321 @@
-from django.test import TestCase
+import sys
+import threading
+from datetime import time, timedelta
+from time import perf_counter
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError, connection, transaction
+from django.test import TestCase, TransactionTestCase
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from Payment.payment_service import PaystackService
+from Services.models import Pricing, Service
+from .models import Appointment, ScheduleRule, SlotFull, TimeSlot, WaitlistEntry
+from .scheduling import materialize_slots
+from .waitlist import promote_stranded_waiters
+
+User = get_user_model()
+
+
+def run_concurrently(count, target):
+    """
+    Call target(index) from count threads released together. Returns what
+    each call returned, or the exception it raised, in index order.
+    """
+    barrier = threading.Barrier(count)
+    results = [None] * count
+
+    def run(index):
+        try:
+            barrier.wait()
+            results[index] = target(index)
+        except Exception as exc:
+            results[index] = exc
+        finally:
+            # Each thread has its own connection to the test database
+            connection.close()
+
+    threads = [threading.Thread(target=run, args=(index,)) for index in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def make_user(email, **extra_fields):
+    # No password, so no time goes into hashing one
+    return User.objects.create_user(email=email, first_name='Test', last_name='User', **extra_fields)
+
+
+def stub_outside_services(testcase):
+    """Keep Paystack out of a test"""
+    for target, attribute, value in [
+        (PaystackService, 'initialize_payment', 'https://checkout.paystack.com/test'),
+        (PaystackService, 'is_subaccount_active', True),
+    ]:
+        patcher = mock.patch.object(target, attribute, return_value=value)
+        patcher.start()
+        testcase.addCleanup(patcher.stop)
+
+
+def make_service():
+    """A business with one priced service"""
+    business = make_user('business@example.com', is_business=True)
+    service = Service.objects.create(business=business, name='Haircut')
+    return service, Pricing.objects.create(service=service, price=50)
+
+
+def make_timeslot(service, hour=9, capacity=1):
+    """A one-hour slot of the service's business two days ahead"""
+    return TimeSlot.objects.create(
+        business=service.business,
+        date=timezone.localdate() + timedelta(days=2),
+        start_time=time(hour),
+        end_time=time(hour + 1),
+        capacity=capacity,
+    )
+
+
+def booked_count(timeslot):
+    return TimeSlot.objects.values_list('booked_count', flat=True).get(pk=timeslot.pk)
+
+
+class SeatCountingTests(TestCase):
+    def setUp(self):
+        self.service, self.pricing = make_service()
+        self.timeslot = make_timeslot(self.service, capacity=2)
+        self.customer = make_user('customer@example.com')
+        stub_outside_services(self)
+
+    def book(self):
+        return Appointment.objects.create(
+            user=self.customer, timeslot=self.timeslot, service=self.service, pricing=self.pricing
+        )
+
+    def test_reserve_seat_stops_at_capacity(self):
+        self.assertTrue(TimeSlot.reserve_seat(self.timeslot.pk))
+        self.assertTrue(TimeSlot.reserve_seat(self.timeslot.pk))
+        self.assertFalse(TimeSlot.reserve_seat(self.timeslot.pk))
+        self.assertEqual(booked_count(self.timeslot), 2)
+
+    def test_release_seats_gives_back_one_seat_per_occurrence(self):
+        other = make_timeslot(self.service, hour=11, capacity=3)
+        for timeslot_id in (self.timeslot.pk, self.timeslot.pk, other.pk, other.pk, other.pk):
+            self.assertTrue(TimeSlot.reserve_seat(timeslot_id))
+
+        TimeSlot.release_seats([self.timeslot.pk, other.pk, other.pk])
+
+        self.assertEqual(booked_count(self.timeslot), 1)
+        self.assertEqual(booked_count(other), 1)
+
+    def test_booked_count_cannot_exceed_capacity(self):
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            TimeSlot.objects.filter(pk=self.timeslot.pk).update(booked_count=3)
+
+    def test_appointments_hold_and_release_their_seat(self):
+        first = self.book()
+        second = self.book()
+        self.assertEqual(booked_count(self.timeslot), 2)
+        with self.assertRaises(SlotFull):
+            self.book()
+
+        first.status = Appointment.STATUS_CANCELED
+        first.save()
+        self.assertEqual(booked_count(self.timeslot), 1)
+
+        second.status = Appointment.STATUS_CONFIRMED
+        second.save()
+        self.assertEqual(booked_count(self.timeslot), 1)
+
+        second.delete()
+        self.assertEqual(booked_count(self.timeslot), 0)
+
+    def test_saving_a_stale_timeslot_keeps_the_booked_count(self):
+        self.book()
+        self.timeslot.capacity = 3
+        self.timeslot.save()
+        self.assertEqual(booked_count(self.timeslot), 1)
+
+
+class ConcurrentSeatTests(TransactionTestCase):
+    def test_concurrent_reserve_seat_never_oversells(self):
+        service, _ = make_service()
+        timeslot = make_timeslot(service, capacity=3)
+
+        results = run_concurrently(10, lambda index: TimeSlot.reserve_seat(timeslot.pk))
+
+        self.assertEqual(results.count(True), 3)
+        self.assertEqual(results.count(False), 7)
+        self.assertEqual(booked_count(timeslot), 3)
+
+
+class BookingHammerTests(TransactionTestCase):
+    """Customers booking through the API all at the same moment"""
+    CUSTOMERS = 12
+
+    def setUp(self):
+        self.service, self.pricing = make_service()
+        self.customers = [make_user(f'customer{index}@example.com') for index in range(self.CUSTOMERS)]
+        stub_outside_services(self)
+
+    def book(self, index, timeslot):
+        client = APIClient()
+        client.force_authenticate(self.customers[index])
+        data = {'timeslot': timeslot.pk, 'service': self.service.pk, 'pricing_id': self.pricing.pk}
+        return client.post(reverse('appointment-create'), data, format='json').status_code
+
+    def hammer(self, label, timeslots):
+        """Book timeslots[index] for customer index, all at once, and report the throughput"""
+        started = perf_counter()
+        results = run_concurrently(len(timeslots), lambda index: self.book(index, timeslots[index]))
+        elapsed = perf_counter() - started
+        sys.stderr.write(f"\n{label}: {len(timeslots)} requests in {elapsed * 1000:.0f} ms, "
+                         f"{len(timeslots) / elapsed:.0f} requests/s ")
+        return results
+
+    def test_hot_slot_has_one_winner(self):
+        timeslot = make_timeslot(self.service)
+
+        results = self.hammer("hot slot", [timeslot] * self.CUSTOMERS)
+
+        self.assertEqual(results.count(201), 1, results)
+        self.assertEqual(results.count(409), self.CUSTOMERS - 1, results)
+        self.assertEqual(booked_count(timeslot), 1)
+        self.assertEqual(
+            Appointment.objects.filter(timeslot=timeslot, status__in=Appointment.BLOCKING_STATUSES).count(), 1
+        )
+
+    def test_hot_slot_fills_its_capacity(self):
+        timeslot = make_timeslot(self.service, capacity=3)
+
+        results = self.hammer("hot slot, 3 seats", [timeslot] * self.CUSTOMERS)
+
+        self.assertEqual(results.count(201), 3, results)
+        self.assertEqual(results.count(409), self.CUSTOMERS - 3, results)
+        self.assertEqual(booked_count(timeslot), 3)
+        self.assertEqual(
+            Appointment.objects.filter(timeslot=timeslot, status__in=Appointment.BLOCKING_STATUSES).count(), 3
+        )
+
+    def test_cold_slots_are_booked_side_by_side(self):
+        timeslots = [make_timeslot(self.service, hour=8 + index) for index in range(self.CUSTOMERS)]
+
+        results = self.hammer("cold slots", timeslots)
+
+        self.assertEqual(results, [201] * self.CUSTOMERS)
+        self.assertEqual(
+            Appointment.objects.filter(status__in=Appointment.BLOCKING_STATUSES).count(), self.CUSTOMERS
+        )
+
+
+class StrandedWaiterTests(TestCase):
+    """A free seat next to a waiter goes to the waiter"""
+    def setUp(self):
+        self.service, self.pricing = make_service()
+        self.timeslot = make_timeslot(self.service)
+        self.waiter = WaitlistEntry.objects.create(
+            user=make_user('waiter@example.com'), timeslot=self.timeslot, service=self.service, pricing=self.pricing,
+        )
+        stub_outside_services(self)
+
+    def post(self, email, url_name):
+        client = APIClient()
+        client.force_authenticate(make_user(email))
+        data = {'timeslot': self.timeslot.pk, 'service': self.service.pk, 'pricing': self.pricing.pk,
+                'pricing_id': self.pricing.pk}
+        return client.post(reverse(url_name), data, format='json')
+
+    def assertPromoted(self):
+        self.waiter.refresh_from_db()
+        self.assertEqual(self.waiter.status, WaitlistEntry.STATUS_PROMOTED)
+        self.assertEqual(booked_count(self.timeslot), 1)
+
+    def test_joining_promotes_once_committed(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.post('late@example.com', 'waitlist-list-create')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertPromoted()
+        self.assertEqual(WaitlistEntry.objects.get(user__email='late@example.com').status, WaitlistEntry.STATUS_WAITING)
+
+    def test_booking_hands_the_seat_to_the_waiter(self):
+        response = self.post('customer@example.com', 'appointment-create')
+
+        self.assertEqual(response.status_code, 409)
+        self.assertPromoted()
+
+    def test_sweep_promotes_stranded_waiters(self):
+        promoted, = promote_stranded_waiters()
+
+        self.assertEqual(promoted.user_id, self.waiter.user_id)
+        self.assertPromoted()
+
+
+class CalendarFeedTests(TestCase):
+    def setUp(self):
+        stub_outside_services(self)
+        self.service, self.pricing = make_service()
+        self.business = self.service.business
+        self.business.calendar_token = 'token'
+        self.business.save(update_fields=['calendar_token'])
+        self.timeslot = make_timeslot(self.service)
+        Appointment.objects.create(
+            user=make_user('customer@example.com'), timeslot=self.timeslot, service=self.service, pricing=self.pricing,
+        )
+        self.url = reverse('calendar-feed', args=['token'])
+
+    def get(self, if_none_match):
+        return self.client.get(self.url, headers={'If-None-Match': if_none_match})
+
+    def test_matching_etags_answer_not_modified(self):
+        etag = self.client.get(self.url)['ETag']
+
+        for header in [etag, f'W/{etag}', f'"other", {etag}', '*']:
+            with self.subTest(header=header):
+                self.assertEqual(self.get(header).status_code, 304)
+        self.assertEqual(self.get('"other"').status_code, 200)
+
+    def test_slot_and_service_edits_change_the_etag(self):
+        etag = self.client.get(self.url)['ETag']
+        self.timeslot.refresh_from_db()
+        self.timeslot.end_time = time(11)
+        self.timeslot.save()
+
+        response = self.get(etag)
+        self.assertEqual(response.status_code, 200)
+
+        self.service.name = 'Beard trim'
+        self.service.save()
+        self.assertEqual(self.get(response['ETag']).status_code, 200)
+
+
+class ConcurrentGenerationTests(TransactionTestCase):
+    def setUp(self):
+        self.business = make_user('business@example.com', is_business=True)
+        for weekday in range(7):
+            ScheduleRule.objects.create(
+                business=self.business, weekday=weekday, start_time=time(9), end_time=time(17), slot_length=60,
+            )
+        self.date_from = timezone.localdate() + timedelta(days=1)
+        self.date_to = self.date_from + timedelta(days=13)
+
+    def test_racing_generations_create_each_slot_once(self):
+        results = run_concurrently(6, lambda index: materialize_slots(self.business, self.date_from, self.date_to))
+
+        self.assertEqual(sorted(results), [0] * 5 + [14 * 8], results)
+        self.assertEqual(TimeSlot.objects.filter(business=self.business).count(), 14 * 8)
+
+    def test_slot_taken_during_generation_answers_409(self):
+        client = APIClient()
+        client.force_authenticate(self.business)
+        data = {'date_from': self.date_from, 'date_to': self.date_to}
+
+        with mock.patch.object(TimeSlot.objects, 'bulk_create', side_effect=IntegrityError('timeslot_no_overlap_per_business')):
+            response = client.post(reverse('timeslot-generate'), data, format='json')
+
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(TimeSlot.objects.exists())
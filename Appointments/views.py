@@ -4,26 +4,59 @@ from django.shortcuts import render
 
 from rest_framework import generics, viewsets, status
 from rest_framework.permissions import IsAuthenticated, IsAuthenticatedOrReadOnly
-from .models import TimeSlot, Appointment
-from .serializers import TimeSlotSerializer, AppointmentSerializer, TimeSlotSerializer, AppointmentCreateSerializer
-from rest_framework.exceptions import ValidationError
+from .models import TimeSlot, Appointment, ScheduleRule, ScheduleException, SlotFull, WaitlistEntry
+from .serializers import (
+    TimeSlotSerializer, AppointmentSerializer, AppointmentCreateSerializer, AvailabilityQuerySerializer,
+    ScheduleRuleSerializer, ScheduleExceptionSerializer, SlotGenerationSerializer, WaitlistEntrySerializer,
+)
+from .availability import available_slots, with_free_seat
+from .scheduling import materialize_slots, find_conflicts, BATCH_SIZE
+from .booking import book_appointment, SlotUnavailable
+from .waitlist import promote_waitlist
+from .ical import feed_appointments, feed_etag, render_calendar
+from django.db import IntegrityError, transaction
+from rest_framework.exceptions import ValidationError, PermissionDenied
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from Payment.payment_service import PaystackService
+from Payment.payment_service import PaystackService, PaymentUnavailable
+from Payment.models import PaymentIntent
 from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from django.http import HttpResponseNotModified, JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_POST
+from rest_framework.exceptions import APIException
+from easybook.async_views import async_api_view, run_sync
+from Payment.async_service import AsyncPaystackService
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags
+from django.contrib.auth import get_user_model
+import secrets
 
 
 
 class AvailableTimeSlotListView(generics.ListAPIView):
     serializer_class = TimeSlotSerializer
     permission_classes = [IsAuthenticated]
+    cursor_ordering = ('start_at', 'id')
 
     def get_queryset(self):
-        # Exclude time slots that have an appointment with status Pending or Confirmed.
-        return TimeSlot.objects.exclude(
-            appointments__status__in=[Appointment.STATUS_PENDING, Appointment.STATUS_CONFIRMED]
-        )
-    
+        # Upcoming time slots with at least one free seat.
+        return with_free_seat(TimeSlot.objects.filter(
+            start_at__gte=timezone.now(),
+        )).order_by('start_at')
+
+
+class FreeTimeSlotListView(generics.ListAPIView):
+    """List free timeslots of a business or service within a date range"""
+    serializer_class = TimeSlotSerializer
+    permission_classes = [IsAuthenticated]
+    cursor_ordering = ('start_at', 'id')
+
+    def get_queryset(self):
+        query = AvailabilityQuerySerializer(data=self.request.query_params)
+        query.is_valid(raise_exception=True)
+        return available_slots(**query.validated_data)
+
 
 
 class AppointmentCreateView(generics.CreateAPIView):
@@ -32,18 +65,8 @@ class AppointmentCreateView(generics.CreateAPIView):
     permission_classes = [IsAuthenticated]
 
     def perform_create(self, serializer):
-        timeslot = serializer.validated_data['timeslot']
-        if Appointment.objects.filter(
-                timeslot=timeslot, 
-                status__in=[Appointment.STATUS_PENDING, Appointment.STATUS_CONFIRMED]
-            ).exists():
-            raise ValidationError("This timeslot is already booked.")
-        
         # Create appointment with payment pending status
-        appointment = serializer.save(
-            user=self.request.user,
-            status=Appointment.STATUS_PAYMENT_PENDING
-        )
+        appointment = book_appointment(serializer, self.request.user)
         
         try:
             # Initialize payment
@@ -57,6 +80,10 @@ class AppointmentCreateView(generics.CreateAPIView):
             # Store payment URL in the response
             self.payment_url = payment_url
             
+        except PaymentUnavailable:
+            # Degraded mode: keep the booking; retry_payment_intents creates
+            # the payment link and payment_status serves it once ready
+            self.payment_url = None
         except Exception as e:
             appointment.status = Appointment.STATUS_PAYMENT_FAILED
             appointment.save()
@@ -66,15 +93,60 @@ class AppointmentCreateView(generics.CreateAPIView):
         response = super().create(request, *args, **kwargs)
         if hasattr(self, 'payment_url'):
             response.data['payment_url'] = self.payment_url
+            response.data['payment_deferred'] = self.payment_url is None
         return response
 
 
+def _book_for_request(request):
+    serializer = AppointmentCreateSerializer(data=request.data, context={'request': request})
+    serializer.is_valid(raise_exception=True)
+    appointment = book_appointment(serializer, request.user)
+    # Load what the payment payload needs before going back to the event loop
+    appointment.service.business
+    return appointment, serializer.data
+
+
+@require_POST
+@async_api_view
+async def appointment_create_async(request):
+    """
+    AppointmentCreateView for ASGI: the booking transaction runs on the
+    shared thread pool, then Paystack is called on the event loop so the
+    worker is free to serve other requests while it waits.
+    """
+    try:
+        appointment, response_data = await run_sync(_book_for_request)(request)
+    except APIException as exc:
+        return JsonResponse(exc.detail, status=exc.status_code, safe=False)
+
+    try:
+        response_data['payment_url'] = await AsyncPaystackService().initialize_payment(
+            appointment=appointment,
+            email=request.user.email,
+            amount=appointment.pricing.price
+        )
+    except PaymentUnavailable:
+        response_data['payment_url'] = None
+    except Exception as e:
+        appointment.status = Appointment.STATUS_PAYMENT_FAILED
+        await run_sync(appointment.save)()
+        return JsonResponse([f"Payment initialization failed: {str(e)}"], status=status.HTTP_400_BAD_REQUEST, safe=False)
+    response_data['payment_deferred'] = response_data['payment_url'] is None
+    return JsonResponse(response_data, status=status.HTTP_201_CREATED)
+
+
 class AppointmentDetailView(generics.RetrieveUpdateDestroyAPIView):
     serializer_class = AppointmentSerializer
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
         return Appointment.objects.filter(user=self.request.user)
+
+    def perform_update(self, serializer):
+        try:
+            serializer.save()
+        except SlotFull:
+            raise SlotUnavailable()
     
 
 class TimeSlotCreateView(generics.CreateAPIView):
@@ -82,21 +154,181 @@ class TimeSlotCreateView(generics.CreateAPIView):
     serializer_class = TimeSlotSerializer
     permission_classes = [IsAuthenticatedOrReadOnly] 
 
+    def perform_create(self, serializer):
+        try:
+            with transaction.atomic():
+                serializer.save(business=self.request.user)
+        except IntegrityError:
+            # A concurrent request created an overlapping slot after validation
+            raise ValidationError("This timeslot overlaps an existing timeslot")
+
+
+class TimeSlotBulkCreateView(generics.GenericAPIView):
+    """Create many timeslots at once, reporting every overlap in one response"""
+    serializer_class = TimeSlotSerializer
+    permission_classes = [IsAuthenticated]
+    max_batch = 5000
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data, many=True)
+        serializer.is_valid(raise_exception=True)
+        if len(serializer.validated_data) > self.max_batch:
+            raise ValidationError(f"At most {self.max_batch} timeslots can be created per request")
+
+        slots = []
+        for item in serializer.validated_data:
+            start_at, end_at = TimeSlot.bounds(item['date'], item['start_time'], item['end_time'])
+            slots.append(TimeSlot(business=request.user, start_at=start_at, end_at=end_at, **item))
+
+        conflicts = find_conflicts(request.user, [(slot.start_at, slot.end_at) for slot in slots])
+        if conflicts:
+            return Response({"conflicts": conflicts}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            with transaction.atomic():
+                TimeSlot.objects.bulk_create(slots, batch_size=BATCH_SIZE)
+        except IntegrityError:
+            raise ValidationError("Timeslots were created concurrently that overlap this request; please retry")
+        return Response(self.get_serializer(slots, many=True).data, status=status.HTTP_201_CREATED)
+
+
+class BusinessOnlyMixin:
+    def check_permissions(self, request):
+        super().check_permissions(request)
+        if not request.user.is_business:
+            raise PermissionDenied("Only business users can manage schedules")
+
+
+class ScheduleRuleListCreateView(BusinessOnlyMixin, generics.ListCreateAPIView):
+    serializer_class = ScheduleRuleSerializer
+    permission_classes = [IsAuthenticated]
+    cursor_ordering = ('id',)
+
+    def get_queryset(self):
+        return ScheduleRule.objects.filter(business=self.request.user).prefetch_related('breaks')
+
+    def perform_create(self, serializer):
+        serializer.save(business=self.request.user)
+
+
+class ScheduleExceptionListCreateView(BusinessOnlyMixin, generics.ListCreateAPIView):
+    serializer_class = ScheduleExceptionSerializer
+    permission_classes = [IsAuthenticated]
+    cursor_ordering = ('date', 'id')
+
+    def get_queryset(self):
+        return ScheduleException.objects.filter(business=self.request.user)
+
+    def perform_create(self, serializer):
+        serializer.save(business=self.request.user)
+
+
+class TimeSlotGenerateView(BusinessOnlyMixin, generics.GenericAPIView):
+    """Materialize timeslots from the business's schedule rules for a date range"""
+    serializer_class = SlotGenerationSerializer
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        created = materialize_slots(request.user, **serializer.validated_data)
+        return Response({"created": created}, status=status.HTTP_201_CREATED)
+
+
+class WaitlistListCreateView(generics.ListCreateAPIView):
+    """Join the waitlist of a full timeslot, or list your waitlist entries"""
+    serializer_class = WaitlistEntrySerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        return WaitlistEntry.objects.filter(user=self.request.user)
+
+    def perform_create(self, serializer):
+        try:
+            with transaction.atomic():
+                entry = serializer.save(user=self.request.user)
+                # A seat freed while joining found no one to promote
+                transaction.on_commit(lambda: promote_waitlist(entry.timeslot_id))
+        except IntegrityError:
+            raise ValidationError("You are already on the waitlist for this timeslot")
+
+
+class WaitlistLeaveView(generics.DestroyAPIView):
+    serializer_class = WaitlistEntrySerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        return WaitlistEntry.objects.filter(user=self.request.user, status=WaitlistEntry.STATUS_WAITING)
+
+    def perform_destroy(self, instance):
+        instance.status = WaitlistEntry.STATUS_CANCELED
+        instance.save(update_fields=['status'])
+
+
+class CalendarTokenView(BusinessOnlyMixin, generics.GenericAPIView):
+    """Get the business's calendar feed URL (GET) or create/replace its token (POST)"""
+    permission_classes = [IsAuthenticated]
+
+    def feed_response(self, request, status_code=status.HTTP_200_OK):
+        return Response(
+            {"url": request.build_absolute_uri(f"/calendar/{request.user.calendar_token}.ics")},
+            status=status_code
+        )
+
+    def get(self, request, *args, **kwargs):
+        if not request.user.calendar_token:
+            return Response(
+                {"error": "No calendar feed yet; POST to this URL to create one"},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        return self.feed_response(request)
+
+    def post(self, request, *args, **kwargs):
+        request.user.calendar_token = secrets.token_urlsafe(32)
+        request.user.save(update_fields=['calendar_token'])
+        return self.feed_response(request, status.HTTP_201_CREATED)
+
+
+def calendar_feed(request, token):
+    """
+    Stream a business's appointments as an iCalendar file. The token in the
+    URL is the credential, since calendar apps cannot send JWTs. Unchanged
+    calendars are answered with a 304 after a single aggregate query.
+    """
+    business = get_object_or_404(get_user_model(), calendar_token=token, is_business=True)
+    appointments = feed_appointments(business)
+    etag = feed_etag(appointments)
+    if_none_match = parse_etags(request.headers.get('If-None-Match', ''))
+    # Weak comparison, as RFC 9110 asks of If-None-Match
+    if '*' in if_none_match or etag in [tag.removeprefix('W/') for tag in if_none_match]:
+        response = HttpResponseNotModified()
+    else:
+        response = StreamingHttpResponse(render_calendar(business, appointments), content_type='text/calendar; charset=utf-8')
+        response['Content-Disposition'] = 'inline; filename="easybook.ics"'
+    response['ETag'] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
 
 class TimeSlotViewSet(viewsets.ModelViewSet):
     queryset = TimeSlot.objects.all()
     serializer_class = TimeSlotSerializer
+    cursor_ordering = ('start_at', 'id')
 
 class AppointmentViewSet(viewsets.ModelViewSet):
     queryset = Appointment.objects.all()
     serializer_class = AppointmentSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        return Appointment.objects.filter(user=self.request.user)
 
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         
         # Create appointment with payment pending status
-        appointment = serializer.save(status=Appointment.STATUS_PAYMENT_PENDING)
+        appointment = book_appointment(serializer, request.user)
         
         try:
             # Initialize payment
@@ -110,8 +342,15 @@ class AppointmentViewSet(viewsets.ModelViewSet):
             # Return appointment data with payment URL
             response_data = serializer.data
             response_data['payment_url'] = payment_url
+            response_data['payment_deferred'] = False
             return Response(response_data, status=status.HTTP_201_CREATED)
             
+        except PaymentUnavailable:
+            # Accepted while Paystack is down; the link follows via payment_status
+            response_data = serializer.data
+            response_data['payment_url'] = None
+            response_data['payment_deferred'] = True
+            return Response(response_data, status=status.HTTP_201_CREATED)
         except Exception as e:
             # If payment initialization fails, update appointment status
             appointment.status = Appointment.STATUS_PAYMENT_FAILED
@@ -123,9 +362,12 @@ class AppointmentViewSet(viewsets.ModelViewSet):
 
     @action(detail=True, methods=['get'])
     def payment_status(self, request, pk=None):
+        """Status of a booking and its payment link, which a deferred booking gets later"""
         appointment = self.get_object()
+        # Served from the stored payment intent; Paystack is not called
+        intent = PaymentIntent.objects.filter(appointment=appointment).only('authorization_url').first()
         return Response({
             'status': appointment.status,
-            'payment_url': request.build_absolute_uri(f'/api/payment/appointments/{appointment.id}/initialize/')
+            'payment_url': (intent.authorization_url or None) if intent else None
         })
 
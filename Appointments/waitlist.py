@@ -0,0 +1,65 @@
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef
+from django.utils import timezone
+
+from Payment.models import PaymentIntent
+from .models import Appointment, TimeSlot, WaitlistEntry, SlotFull
+
+
+def promote_waitlist(timeslot_id):
+    """
+    Hand free seats of a timeslot to the earliest waiters. Each promotion
+    runs in its own transaction: the entry is claimed, a payment-pending
+    appointment takes the seat and the entry is marked promoted. Its payment
+    intent is initialized by retry_payment_intents, and the appointment's
+    post_save notification goes out once the payment link exists.
+    Returns the appointments created.
+    """
+    promoted = []
+    while True:
+        try:
+            with transaction.atomic():
+                entry = (
+                    WaitlistEntry.objects.select_for_update(skip_locked=True)
+                    .select_related('pricing')
+                    .filter(timeslot_id=timeslot_id, status=WaitlistEntry.STATUS_WAITING)
+                    .order_by('created_at', 'id')
+                    .first()
+                )
+                if entry is None:
+                    break
+                appointment = Appointment.objects.create(
+                    user_id=entry.user_id,
+                    timeslot_id=entry.timeslot_id,
+                    service_id=entry.service_id,
+                    pricing_id=entry.pricing_id,
+                    status=Appointment.STATUS_PAYMENT_PENDING,
+                )
+                if entry.pricing is not None:
+                    PaymentIntent.objects.create(appointment=appointment, amount=entry.pricing.price)
+                entry.status = WaitlistEntry.STATUS_PROMOTED
+                entry.appointment = appointment
+                entry.save(update_fields=['status', 'appointment'])
+        except SlotFull:
+            # No seat left; the remaining waiters keep their place
+            break
+        promoted.append(appointment)
+    return promoted
+
+
+def promote_stranded_waiters():
+    """
+    Promote waiters of upcoming timeslots that have free seats, which a
+    seat released before they joined leaves behind. Returns the
+    appointments created.
+    """
+    waiting = WaitlistEntry.objects.filter(timeslot=OuterRef('pk'), status=WaitlistEntry.STATUS_WAITING)
+    timeslot_ids = TimeSlot.objects.filter(
+        Exists(waiting),
+        booked_count__lt=F('capacity'),
+        start_at__gt=timezone.now(),
+    ).values_list('id', flat=True)
+    promoted = []
+    for timeslot_id in timeslot_ids:
+        promoted.extend(promote_waitlist(timeslot_id))
+    return promoted
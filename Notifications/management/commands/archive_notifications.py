@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from Notifications.retention import BATCH_SIZE, apply_retention
+
+
+class Command(BaseCommand):
+    help = (
+        "Move finished notifications older than NOTIFICATION_RETENTION to the archive "
+        "and delete archived ones older than NOTIFICATION_ARCHIVE_RETENTION"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help="Rows moved or deleted per transaction")
+        parser.add_argument('--max-chunks', type=int, default=None,
+                            help="Stop after this many chunks of each kind per run")
+        parser.add_argument('--loop', action='store_true', help="Keep running, sleeping --interval between runs")
+        parser.add_argument('--interval', type=float, default=3600, help="Seconds between runs in --loop mode")
+
+    def handle(self, *args, **options):
+        while True:
+            archived, purged = apply_retention(options['batch_size'], options['max_chunks'])
+            self.stdout.write(f"Archived {archived} notification(s), purged {purged} archived notification(s)")
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from Notifications.outbox import BATCH_SIZE, next_due, send_pending_notifications
+
+
+class Command(BaseCommand):
+    help = "Send due notifications from the outbox; several workers may run at once"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help="Notifications claimed per batch")
+        parser.add_argument('--loop', action='store_true',
+                            help="Keep running, waking when the next notification is due")
+        parser.add_argument('--interval', type=float, default=5,
+                            help="Longest sleep in --loop mode, which bounds the lag of newly queued notifications")
+
+    def handle(self, *args, **options):
+        while True:
+            handled = send_pending_notifications(options['batch_size'])
+            if handled or not options['loop']:
+                self.stdout.write(f"Handled {handled} notification(s)")
+            if not options['loop']:
+                break
+            time.sleep(self.sleep_for(options['interval']))
+
+    def sleep_for(self, interval):
+        # Sleep until the next scheduled notification, but never longer than
+        # interval so ones queued for right now are picked up quickly
+        due = next_due()
+        if due is None:
+            return interval
+        return min(interval, max(0.0, (due - timezone.now()).total_seconds()))
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Notifications', '0007_alter_notification_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notification',
+            name='context',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='template_key',
+            field=models.CharField(blank=True, max_length=50),
+        ),
+        migrations.AlterField(
+            model_name='notification',
+            name='message',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AlterField(
+            model_name='notification',
+            name='subject',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+    ]
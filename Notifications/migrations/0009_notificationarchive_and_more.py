@@ -0,0 +1,56 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:05
+
+import django.contrib.postgres.indexes
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Appointments', '0014_waitlist'),
+        ('Notifications', '0008_notification_context_notification_template_key_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationArchive',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('appointment_id', models.UUIDField(blank=True, null=True)),
+                ('notification_type', models.CharField(choices=[('reminder', 'Reminder'), ('confirmation', 'Confirmation'), ('update', 'Update'), ('appointment_created', 'Appointment Created'), ('appointment_updated', 'Appointment Updated'), ('appointment_cancelled', 'Appointment Cancelled'), ('appointment_reminder', 'Appointment Reminder')], max_length=30)),
+                ('template_key', models.CharField(blank=True, max_length=50)),
+                ('context', models.JSONField(blank=True, default=dict)),
+                ('subject', models.CharField(blank=True, max_length=255)),
+                ('message', models.TextField(blank=True)),
+                ('html_message', models.TextField(blank=True)),
+                ('scheduled_at', models.DateTimeField()),
+                ('status', models.CharField(max_length=10)),
+                ('mailersend_id', models.CharField(blank=True, max_length=100)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('last_error', models.TextField(blank=True)),
+                ('sent_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['status', 'created_at'], name='notification_retention_idx'),
+        ),
+        migrations.AddField(
+            model_name='notificationarchive',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_notifications', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='notificationarchive',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='notif_archive_user_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notificationarchive',
+            index=django.contrib.postgres.indexes.BrinIndex(fields=['created_at'], name='notif_archive_created_brin'),
+        ),
+    ]
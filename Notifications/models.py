@@ -1,5 +1,8 @@
+from django.contrib.postgres.indexes import BrinIndex
 from django.db import models
 from django.conf import settings
+from django.utils import timezone
+from .rendering import Rendered, appointment_context, render
 
 class UserNotificationPreference(models.Model):
     user = models.OneToOneField(
@@ -9,7 +12,19 @@ class UserNotificationPreference(models.Model):
     email_enabled = models.BooleanField(default=True)
     email = models.EmailField()
 
-class Notification(models.Model):
+class RenderedMixin:
+    """
+    rendered() of Notification and NotificationArchive: templated rows
+    keep only their template key and context, the others their own text
+    """
+    def rendered(self):
+        """Subject, text and html of the notification"""
+        if self.template_key:
+            return render(self.template_key, self.context)
+        return Rendered(self.subject, self.message, self.html_message)
+
+
+class Notification(RenderedMixin, models.Model):
     NOTIFICATION_TYPES = (
         ('reminder', 'Reminder'),
         ('confirmation', 'Confirmation'),
@@ -24,15 +39,91 @@ class Notification(models.Model):
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE
     )
+    # The appointment an email is about; its payment link is added when sent
+    appointment = models.ForeignKey(
+        'Appointments.Appointment',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='notifications'
+    )
     notification_type = models.CharField(max_length=30, choices=NOTIFICATION_TYPES)
-    subject = models.CharField(max_length=255)
-    message = models.TextField()
+    # Templated notifications keep only their template key and context and
+    # are rendered when sent or read; the text fields below stay empty
+    template_key = models.CharField(max_length=50, blank=True)
+    context = models.JSONField(default=dict, blank=True)
+    subject = models.CharField(max_length=255, blank=True)
+    message = models.TextField(blank=True)
     html_message = models.TextField(blank=True)  # New HTML content field
     scheduled_at = models.DateTimeField()
     status = models.CharField(
         max_length=10,
-        choices=[('pending', 'Pending'), ('sent', 'Sent'), ('failed', 'Failed')],
+        choices=[('pending', 'Pending'), ('sent', 'Sent'), ('failed', 'Failed'), ('cancelled', 'Cancelled')],
         default='pending'
     )
     mailersend_id = models.CharField(max_length=100, blank=True)  # Tracking ID
-    created_at = models.DateTimeField(auto_now_add=True)
\ No newline at end of file
+    # Delivery bookkeeping of the outbox worker
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    @classmethod
+    def about_appointment(cls, appointment, created=False):
+        """The unsaved email, due now, about a new or changed appointment"""
+        kind = 'appointment_created' if created else 'appointment_updated'
+        return cls(
+            user_id=appointment.user_id,
+            appointment=appointment,
+            notification_type=kind,
+            template_key=kind,
+            context=appointment_context(appointment),
+            scheduled_at=timezone.now(),
+        )
+
+    class Meta:
+        indexes = [
+            # Per-user listing, newest first (also the pagination cursor)
+            models.Index(fields=['user', '-created_at', '-id'], name='notification_user_created_idx'),
+            # The outbox: pending notifications that are due
+            models.Index(fields=['status', 'scheduled_at'], name='notification_outbox_idx'),
+            # The retention sweep: finished notifications past their retention
+            models.Index(fields=['status', 'created_at'], name='notification_retention_idx'),
+        ]
+
+
+class NotificationArchive(RenderedMixin, models.Model):
+    """
+    Finished notifications moved out of Notification by archive_notifications
+    once older than NOTIFICATION_RETENTION, keeping their original id. Rows
+    are append-only and purged after NOTIFICATION_ARCHIVE_RETENTION.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='archived_notifications'
+    )
+    # Not a foreign key, so deleting an appointment never touches the archive
+    appointment_id = models.UUIDField(null=True, blank=True)
+    notification_type = models.CharField(max_length=30, choices=Notification.NOTIFICATION_TYPES)
+    template_key = models.CharField(max_length=50, blank=True)
+    context = models.JSONField(default=dict, blank=True)
+    subject = models.CharField(max_length=255, blank=True)
+    message = models.TextField(blank=True)
+    html_message = models.TextField(blank=True)
+    scheduled_at = models.DateTimeField()
+    status = models.CharField(max_length=10)
+    mailersend_id = models.CharField(max_length=100, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-created_at', '-id'], name='notif_archive_user_idx'),
+            # Rows arrive in created_at order, so a BRIN index serves the purge
+            BrinIndex(fields=['created_at'], name='notif_archive_created_brin'),
+        ]
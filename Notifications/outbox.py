@@ -0,0 +1,188 @@
+import logging
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from Appointments.models import Appointment
+from .models import Notification
+from .rendering import brevo_template, params, render_subject
+from .services import EmailService, OutgoingEmail
+
+logger = logging.getLogger(__name__)
+
+# A full batch of emails sharing a template is a single Brevo request
+BATCH_SIZE = 1000
+ROW_UPDATE_CHUNK = 100
+MAX_ATTEMPTS = 5
+DEFAULT_REMINDER_LEAD_TIME = timedelta(hours=24)
+# How long a booking email waits for its payment link before looking again
+PAYMENT_LINK_WAIT = timedelta(seconds=30)
+
+
+def reminder_due(appointment):
+    """When the reminder of an appointment goes out"""
+    return appointment.timeslot.start_at - getattr(settings, 'REMINDER_LEAD_TIME', DEFAULT_REMINDER_LEAD_TIME)
+
+
+def next_due():
+    """scheduled_at of the earliest pending notification, read from the outbox index"""
+    return (
+        Notification.objects.filter(status='pending')
+        .order_by('scheduled_at')
+        .values_list('scheduled_at', flat=True)
+        .first()
+    )
+
+
+def retry_delay(attempts):
+    return timedelta(minutes=2 ** attempts)
+
+
+def payment_intent(appointment):
+    """The payment intent of an appointment, or None when it has none"""
+    return getattr(appointment, 'payment_intent', None) if appointment is not None else None
+
+
+def prepare(notification, now):
+    """
+    The OutgoingEmail of a claimed notification, or None when it must not
+    be sent, in which case the notification is already marked failed or
+    cancelled
+    """
+    notification.attempts += 1
+    notification.context_changed = False
+    notification.postponed = False
+    if notification.notification_type == 'appointment_reminder' and (
+        notification.appointment is None
+        or notification.appointment.status not in Appointment.BLOCKING_STATUSES
+    ):
+        # Cancelled, failed or deleted since the reminder was scheduled
+        notification.status = 'cancelled'
+        return None
+
+    preference = getattr(notification.user, 'usernotificationpreference', None)
+    if preference is not None and not preference.email_enabled:
+        notification.status = 'failed'
+        notification.last_error = 'Email disabled by the user'
+        return None
+
+    intent = payment_intent(notification.appointment)
+    if notification.template_key == 'appointment_created' and 'payment_url' not in notification.context and intent:
+        if intent.authorization_url:
+            # Kept in the context so the notification reads the same later
+            notification.context['payment_url'] = intent.authorization_url
+            notification.context_changed = True
+        elif notification.appointment.status == Appointment.STATUS_PAYMENT_PENDING:
+            # Paystack is never called under the batch's row locks: the link
+            # comes from the booking request or retry_payment_intents, which
+            # bring the email forward once it exists. Waiting is no attempt.
+            notification.postponed = True
+            notification.retry_at = now + PAYMENT_LINK_WAIT
+            return None
+
+    to = preference.email if preference is not None else notification.user.email
+    if notification.template_key:
+        # Sent as a version of its key's Brevo template; the text and html
+        # are only rendered with the context's values by Brevo
+        values = params(notification.context)
+        template = (notification.template_key, frozenset(values))
+        _, text_content, html_content = brevo_template(*template)
+        return OutgoingEmail(
+            to=to,
+            subject=render_subject(notification.template_key, notification.context),
+            text_content=text_content,
+            html_content=html_content,
+            params=values,
+            template=template,
+        )
+    rendered = notification.rendered()
+    return OutgoingEmail(
+        to=to,
+        subject=rendered.subject,
+        text_content=rendered.message,
+        html_content=rendered.html_message,
+    )
+
+
+def record_result(notification, success, message, message_id, now):
+    if success:
+        notification.status = 'sent'
+        notification.sent_at = now
+        notification.mailersend_id = message_id
+        notification.last_error = ''
+    elif notification.attempts >= MAX_ATTEMPTS:
+        notification.status = 'failed'
+        notification.last_error = message
+    else:
+        # Stays pending, out of the way of due rows until the retry is due
+        notification.scheduled_at = notification.retry_at = now + retry_delay(notification.attempts)
+        notification.last_error = message
+
+
+def write_results(batch):
+    """
+    Save the outcomes of a batch. Rows sharing an outcome are written by one
+    UPDATE; only the per-row message ids and contexts given a payment link
+    need a bulk_update, which is much slower per row. Postponed rows keep
+    their attempt count.
+    """
+    outcomes = defaultdict(list)
+    for notification in batch:
+        key = (
+            notification.status, notification.sent_at, notification.last_error,
+            getattr(notification, 'retry_at', None), getattr(notification, 'postponed', False),
+        )
+        outcomes[key].append(notification.id)
+    for (status, sent_at, last_error, retry_at, postponed), ids in outcomes.items():
+        changes = {'status': status, 'sent_at': sent_at, 'last_error': last_error}
+        if retry_at is not None:
+            changes['scheduled_at'] = retry_at
+        Notification.objects.filter(id__in=ids).update(attempts=F('attempts') + (0 if postponed else 1), **changes)
+    # Small chunks: each row of a bulk UPDATE walks the whole CASE expression
+    Notification.objects.bulk_update([n for n in batch if n.mailersend_id], ['mailersend_id'], batch_size=ROW_UPDATE_CHUNK)
+    Notification.objects.bulk_update(
+        [n for n in batch if getattr(n, 'context_changed', False)], ['context'], batch_size=ROW_UPDATE_CHUNK
+    )
+
+
+def send_pending_notifications(batch_size=BATCH_SIZE):
+    """
+    Send due notifications a batch at a time. Each batch is claimed with
+    SELECT ... FOR UPDATE SKIP LOCKED and stays locked until its results are
+    written back with one bulk UPDATE, so workers running side by side take
+    different batches and nothing is sent twice. Within a batch, emails
+    sharing their template go to Brevo as one request. Returns the number
+    handled.
+    """
+    email_service = EmailService()
+    handled = 0
+    while True:
+        now = timezone.now()
+        with transaction.atomic():
+            batch = list(
+                Notification.objects.select_for_update(of=('self',), skip_locked=True)
+                .select_related('user__usernotificationpreference', 'appointment__payment_intent')
+                .filter(status='pending', scheduled_at__lte=now)
+                .order_by('scheduled_at', 'id')[:batch_size]
+            )
+            outgoing, emails = [], []
+            for notification in batch:
+                try:
+                    email = prepare(notification, now)
+                except Exception as exc:
+                    logger.exception("Notification %s could not be prepared", notification.id)
+                    record_result(notification, False, str(exc), '', now)
+                    continue
+                if email is not None:
+                    outgoing.append(notification)
+                    emails.append(email)
+            for notification, (success, message, message_id) in zip(outgoing, email_service.send_batch(emails)):
+                record_result(notification, success, message, message_id, now)
+            write_results(batch)
+        if not batch:
+            return handled
+        handled += len(batch)
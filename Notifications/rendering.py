@@ -0,0 +1,91 @@
+from collections import namedtuple
+from datetime import date, time
+from functools import lru_cache
+
+from django.template.loader import get_template
+from django.utils.formats import date_format, time_format
+
+# Template key (the notification type) -> directory under
+# templates/notifications/ holding subject.txt, message.txt and message.html
+TEMPLATES = {
+    'appointment_created': 'appointment_created',
+    'appointment_updated': 'appointment_updated',
+    'appointment_reminder': 'appointment_reminder',
+    'appointment_cancelled': 'appointment_cancelled',
+}
+PARTS = ('subject.txt', 'message.txt', 'message.html')
+
+# Context values stored as ISO strings; the templates also get them
+# formatted for display under <key>_display
+DATE_KEYS = ('date',)
+TIME_KEYS = ('start_time', 'end_time')
+DATE_DISPLAY = 'F d, Y'
+TIME_DISPLAY = 'h:i A'
+
+Rendered = namedtuple('Rendered', ['subject', 'message', 'html_message'])
+
+
+@lru_cache(maxsize=None)
+def compiled(template_key):
+    """The subject, text and html templates of a key, compiled once per process"""
+    directory = TEMPLATES[template_key]
+    return tuple(get_template(f'notifications/{directory}/{part}') for part in PARTS)
+
+
+def appointment_context(appointment, pricing=True):
+    """
+    The small JSON context stored with an appointment notification. Leave
+    out pricing for templates that never show it, so their notifications
+    share one set of keys and so one Brevo template.
+    """
+    timeslot = appointment.timeslot
+    context = {
+        'service': appointment.service.name,
+        'date': timeslot.date.isoformat(),
+        'start_time': timeslot.start_time.isoformat(),
+        'end_time': timeslot.end_time.isoformat(),
+    }
+    if pricing and appointment.pricing:
+        context['price'] = str(appointment.pricing.price)
+        context['currency'] = appointment.pricing.currency
+    return context
+
+
+def params(context):
+    """
+    The template values of a stored context, all strings: the context plus
+    its dates and times formatted for display. Brevo fills a template's
+    {{ params.* }} placeholders with them.
+    """
+    values = dict(context)
+    for key in DATE_KEYS:
+        if key in values:
+            values[f'{key}_display'] = date_format(date.fromisoformat(values[key]), DATE_DISPLAY)
+    for key in TIME_KEYS:
+        if key in values:
+            values[f'{key}_display'] = time_format(time.fromisoformat(values[key]), TIME_DISPLAY)
+    return values
+
+
+@lru_cache(maxsize=None)
+def brevo_template(template_key, keys):
+    """
+    Subject, text and html of a key with a {{ params.<key> }} placeholder
+    for each of keys, compiled once per process. Optional values are left
+    out of the context rather than blank, so each set of keys gets its own
+    template and its {% if %} blocks are decided here.
+    """
+    placeholders = {key: '{{ params.%s }}' % key for key in keys}
+    return Rendered(*(template.render(placeholders).strip() for template in compiled(template_key)))
+
+
+def render_subject(template_key, context):
+    """The subject of a notification alone"""
+    return compiled(template_key)[0].render(params(context)).strip()
+
+
+def render(template_key, context):
+    """Subject, plain text and html of a notification"""
+    values = params(context)
+    subject, message, html_message = (template.render(values).strip() for template in compiled(template_key))
+    return Rendered(subject, message, html_message)
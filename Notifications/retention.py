@@ -0,0 +1,78 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Notification, NotificationArchive
+
+# Rows moved or purged per transaction; keeps locks and WAL bursts short
+BATCH_SIZE = 5000
+DEFAULT_NOTIFICATION_RETENTION = timedelta(days=90)
+DEFAULT_NOTIFICATION_ARCHIVE_RETENTION = timedelta(days=730)
+# Pending notifications are never archived, however old
+FINISHED_STATUSES = ('sent', 'failed', 'cancelled')
+ARCHIVED_FIELDS = [
+    'id', 'user_id', 'appointment_id', 'notification_type', 'template_key', 'context', 'subject', 'message',
+    'html_message', 'scheduled_at', 'status', 'mailersend_id', 'attempts', 'last_error', 'sent_at', 'created_at',
+]
+
+
+def retention_cutoff(now=None):
+    return (now or timezone.now()) - getattr(settings, 'NOTIFICATION_RETENTION', DEFAULT_NOTIFICATION_RETENTION)
+
+
+def archive_cutoff(now=None):
+    return (now or timezone.now()) - getattr(
+        settings, 'NOTIFICATION_ARCHIVE_RETENTION', DEFAULT_NOTIFICATION_ARCHIVE_RETENTION
+    )
+
+
+def archive_chunk(cutoff, batch_size=BATCH_SIZE):
+    """
+    Move up to batch_size finished notifications created before cutoff to
+    the archive in one transaction. Returns the number of rows moved.
+    """
+    with transaction.atomic():
+        rows = list(
+            Notification.objects.filter(status__in=FINISHED_STATUSES, created_at__lt=cutoff)
+            .select_for_update(skip_locked=True)
+            .values(*ARCHIVED_FIELDS)[:batch_size]
+        )
+        if not rows:
+            return 0
+        NotificationArchive.objects.bulk_create(
+            [NotificationArchive(**row) for row in rows],
+            ignore_conflicts=True,
+        )
+        Notification.objects.filter(id__in=[row['id'] for row in rows]).delete()
+    return len(rows)
+
+
+def purge_chunk(cutoff, batch_size=BATCH_SIZE):
+    """Delete up to batch_size archived notifications created before cutoff"""
+    ids = list(NotificationArchive.objects.filter(created_at__lt=cutoff).values_list('id', flat=True)[:batch_size])
+    if not ids:
+        return 0
+    NotificationArchive.objects.filter(id__in=ids).delete()
+    return len(ids)
+
+
+def apply_retention(batch_size=BATCH_SIZE, max_chunks=None):
+    """
+    Archive old finished notifications, then purge expired archive rows,
+    chunk by chunk. Stops after max_chunks chunks of each when given.
+    Returns (archived, purged).
+    """
+    now = timezone.now()
+    totals = []
+    for step, cutoff in ((archive_chunk, retention_cutoff(now)), (purge_chunk, archive_cutoff(now))):
+        total = chunks = 0
+        while max_chunks is None or chunks < max_chunks:
+            done = step(cutoff, batch_size)
+            total += done
+            chunks += 1
+            if done < batch_size:
+                break
+        totals.append(total)
+    return tuple(totals)
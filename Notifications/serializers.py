@@ -6,7 +6,22 @@ class NotificationSerializer(serializers.ModelSerializer):
     class Meta:
         model = Notification
         fields = '__all__'
-        read_only_fields = ['status', 'created_at', 'user', 'mailersend_id']
+        read_only_fields = [
+            'status', 'created_at', 'user', 'mailersend_id', 'appointment', 'attempts', 'last_error', 'sent_at',
+            'template_key', 'context',
+        ]
+        # Notifications created through the API carry their own text
+        extra_kwargs = {
+            'subject': {'required': True, 'allow_blank': False},
+            'message': {'required': True, 'allow_blank': False},
+        }
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        if instance.template_key:
+            # Rendered on read; only the template key and context are stored
+            data['subject'], data['message'], data['html_message'] = instance.rendered()
+        return data
         
     def validate_scheduled_at(self, value):
         if value < timezone.now():
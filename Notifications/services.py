@@ -1,15 +1,52 @@
+from collections import namedtuple
 from django.conf import settings
 import logging
-from sib_api_v3_sdk import ApiClient, Configuration, SendSmtpEmail, TransactionalEmailsApi
+import os
+import threading
+from sib_api_v3_sdk import (
+    ApiClient, Configuration, SendSmtpEmail, SendSmtpEmailMessageVersions, SendSmtpEmailTo, TransactionalEmailsApi
+)
 
 logger = logging.getLogger(__name__)
 
+# Brevo accepts at most this many message versions in one request
+MAX_MESSAGE_VERSIONS = 1000
+
+# One email of a batch. Emails with the same template, or the same text
+# and html content when they have none, are sent as versions of one Brevo
+# message; params fill its {{ params.* }} placeholders for each version.
+OutgoingEmail = namedtuple(
+    'OutgoingEmail', ['to', 'subject', 'text_content', 'html_content', 'params', 'template'], defaults=[None, None]
+)
+
+_api_instance = None
+_api_pid = None
+_api_lock = threading.Lock()
+
+
+def get_api_instance():
+    """
+    The process-wide Brevo API, built on first use so its connection pool
+    is reused by every EmailService. A forked worker builds its own.
+    """
+    global _api_instance, _api_pid
+    pid = os.getpid()
+    if _api_instance is None or _api_pid != pid:
+        with _api_lock:
+            if _api_instance is None or _api_pid != pid:
+                config = Configuration()
+                config.api_key['api-key'] = settings.BREVO_API_KEY
+                _api_instance = TransactionalEmailsApi(ApiClient(configuration=config))
+                _api_pid = pid
+    return _api_instance
+
+
 class EmailService:
     def __init__(self):
-        config = Configuration()
-        config.api_key['api-key'] = settings.BREVO_API_KEY
-        self.api_client = ApiClient(configuration=config)
-        self.api_instance = TransactionalEmailsApi(self.api_client)
+        self.api_instance = get_api_instance()
+
+    def sender(self):
+        return {"name": settings.EMAIL_SENDER_NAME, "email": settings.DEFAULT_FROM_EMAIL}
 
     def send_email(self, recipient_email, subject, text_content, html_content=None):
         """
@@ -18,21 +55,68 @@ class EmailService:
         """
         try:
             logger.info(f"Attempting to send email to {recipient_email}")
-            
-            sender = {"name": settings.EMAIL_SENDER_NAME, "email": settings.DEFAULT_FROM_EMAIL}
+
             to = [{"email": recipient_email}]
-            
+
             send_smtp_email = SendSmtpEmail(
                 to=to,
                 html_content=html_content,
                 text_content=text_content,
                 subject=subject,
-                sender=sender
+                sender=self.sender()
             )
-            
+
             result = self.api_instance.send_transac_email(send_smtp_email)
             logger.info(f"Email sent successfully to {recipient_email}")
             return True, 'Email sent successfully'
         except Exception as e:
             logger.error(f"Email Error: {str(e)}")
-            return False, str(e)
\ No newline at end of file
+            return False, str(e)
+
+    def send_batch(self, emails):
+        """
+        Send many OutgoingEmails with as few Brevo calls as possible: emails
+        sharing their template go out as message versions of one request, up
+        to MAX_MESSAGE_VERSIONS each.
+        Returns one (success: bool, message: str, message_id: str) per email,
+        in the order given.
+        """
+        results = [None] * len(emails)
+        groups = {}
+        for index, email in enumerate(emails):
+            key = email.template or (email.text_content, email.html_content)
+            groups.setdefault(key, []).append(index)
+
+        for indexes in groups.values():
+            for start in range(0, len(indexes), MAX_MESSAGE_VERSIONS):
+                chunk = indexes[start:start + MAX_MESSAGE_VERSIONS]
+                for index, result in zip(chunk, self._send_versions([emails[i] for i in chunk])):
+                    results[index] = result
+        return results
+
+    def _send_versions(self, emails):
+        versions = [
+            SendSmtpEmailMessageVersions(
+                to=[SendSmtpEmailTo(email=email.to)],
+                subject=email.subject,
+                params=email.params or None
+            )
+            for email in emails
+        ]
+        try:
+            result = self.api_instance.send_transac_email(SendSmtpEmail(
+                sender=self.sender(),
+                # Brevo requires a top-level subject; every version sets its own
+                subject=emails[0].subject,
+                html_content=emails[0].html_content,
+                text_content=emails[0].text_content,
+                message_versions=versions
+            ))
+        except Exception as e:
+            logger.error(f"Email batch of {len(emails)} failed: {str(e)}")
+            return [(False, str(e), '')] * len(emails)
+
+        message_ids = list(result.message_ids or [])
+        message_ids += [result.message_id] * (len(emails) - len(message_ids))
+        logger.info(f"Email batch of {len(emails)} sent")
+        return [(True, 'Email sent successfully', message_id or '') for message_id in message_ids]
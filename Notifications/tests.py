@@ -0,0 +1,134 @@
+import threading
+import time
+from collections import Counter
+from datetime import timedelta
+from unittest import mock
+
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
+
+from Appointments.tests import make_user, run_concurrently
+from .models import Notification
+from .outbox import send_pending_notifications
+from .rendering import render
+
+
+class FakeBrevo:
+    """Stands in for TransactionalEmailsApi and records every request"""
+    def __init__(self, delay=0, error=None):
+        self.delay = delay
+        self.error = error
+        self.requests = []
+        self.lock = threading.Lock()
+
+    def send_transac_email(self, email):
+        time.sleep(self.delay)
+        if self.error:
+            raise self.error
+        with self.lock:
+            self.requests.append(email)
+            first = sum(len(request.message_versions) for request in self.requests[:-1])
+        ids = [f'<message-{first + index}>' for index in range(len(email.message_versions))]
+        return mock.Mock(message_id=None, message_ids=ids)
+
+    def patch(self):
+        return mock.patch('Notifications.services.get_api_instance', return_value=self)
+
+    def recipients(self):
+        return [version.to[0].email for request in self.requests for version in request.message_versions]
+
+
+def due_notifications(users, **fields):
+    scheduled_at = timezone.now() - timedelta(minutes=1)
+    return Notification.objects.bulk_create([
+        Notification(user=user, scheduled_at=scheduled_at, **fields) for user in users
+    ])
+
+
+class TemplatedBatchTests(TestCase):
+    def setUp(self):
+        self.brevo = FakeBrevo()
+        patcher = self.brevo.patch()
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_notifications_of_one_template_share_a_request(self):
+        users = [make_user(f'customer{index}@example.com') for index in range(3)]
+        for index, user in enumerate(users):
+            due_notifications([user], notification_type='appointment_updated', template_key='appointment_updated', context={
+                'service': f'Service {index}', 'date': '2030-01-0%d' % (index + 1),
+                'start_time': '09:00:00', 'end_time': '10:00:00',
+            })
+
+        self.assertEqual(send_pending_notifications(), 3)
+
+        request, = self.brevo.requests
+        self.assertIn('{{ params.service }}', request.html_content)
+        for version in request.message_versions:
+            notification = Notification.objects.get(user__email=version.to[0].email)
+            rendered = render(notification.template_key, notification.context)
+            html = request.html_content
+            for key, value in version.params.items():
+                html = html.replace('{{ params.%s }}' % key, value)
+            self.assertEqual(html, rendered.html_message)
+            self.assertEqual(version.subject, rendered.subject)
+            self.assertEqual(notification.status, 'sent')
+            self.assertTrue(notification.mailersend_id)
+
+
+class OutboxTests(TestCase):
+    def test_disabled_email_is_not_sent(self):
+        user = make_user('customer@example.com')
+        user.usernotificationpreference.email_enabled = False
+        user.usernotificationpreference.save()
+        notification, = due_notifications([user], notification_type='update', subject='Subject', message='Message')
+        brevo = FakeBrevo()
+
+        with brevo.patch():
+            send_pending_notifications()
+
+        self.assertEqual(brevo.requests, [])
+        self.assertEqual(Notification.objects.get(pk=notification.pk).status, 'failed')
+
+    def test_failed_send_is_retried_later(self):
+        notification, = due_notifications(
+            [make_user('customer@example.com')], notification_type='update', subject='Subject', message='Message',
+        )
+
+        with FakeBrevo(error=Exception('Brevo is down')).patch(), self.assertLogs('Notifications.services', 'ERROR'):
+            self.assertEqual(send_pending_notifications(), 1)
+
+        notification.refresh_from_db()
+        self.assertEqual(notification.status, 'pending')
+        self.assertEqual(notification.attempts, 1)
+        self.assertEqual(notification.last_error, 'Brevo is down')
+        self.assertGreater(notification.scheduled_at, timezone.now())
+
+    def test_same_content_goes_out_as_versions_of_one_request(self):
+        users = [make_user(f'customer{index}@example.com') for index in range(3)]
+        due_notifications(users, notification_type='update', subject='Subject', message='Message')
+        brevo = FakeBrevo()
+
+        with brevo.patch():
+            self.assertEqual(send_pending_notifications(), 3)
+
+        self.assertEqual(len(brevo.requests), 1)
+        self.assertEqual(sorted(brevo.recipients()), sorted(user.email for user in users))
+        self.assertEqual(Notification.objects.values('mailersend_id').distinct().count(), 3)
+
+
+class ConcurrentOutboxTests(TransactionTestCase):
+    def test_workers_side_by_side_send_each_notification_once(self):
+        users = [make_user(f'customer{index}@example.com') for index in range(120)]
+        due_notifications(users, notification_type='update', subject='Subject', message='Message')
+        brevo = FakeBrevo(delay=0.05)
+
+        with brevo.patch():
+            handled = run_concurrently(3, lambda index: send_pending_notifications(batch_size=10))
+
+        self.assertEqual(sum(handled), 120, handled)
+        self.assertEqual(Counter(brevo.recipients()), Counter(user.email for user in users))
+        # Each worker claimed batches of its own
+        self.assertTrue(all(handled), handled)
+        self.assertEqual(Counter(Notification.objects.values_list('status', flat=True)), {'sent': 120})
+        self.assertEqual(Notification.objects.values('mailersend_id').distinct().count(), 120)
@@ -5,7 +5,6 @@ from rest_framework.permissions import IsAuthenticated
 from .models import Notification, UserNotificationPreference
 from .serializers import NotificationSerializer, UserNotificationPreferenceSerializer
 from .services import EmailService
-from django.core.exceptions import ObjectDoesNotExist
 
 class NotificationViewSet(viewsets.ModelViewSet):
     queryset = Notification.objects.all()
@@ -16,33 +15,8 @@ class NotificationViewSet(viewsets.ModelViewSet):
         return Notification.objects.filter(user=self.request.user)
 
     def perform_create(self, serializer):
-        notification = serializer.save(user=self.request.user)
-        self._process_notification(notification)
-
-    def _process_notification(self, notification):
-        try:
-            preference = notification.user.usernotificationpreference
-        except ObjectDoesNotExist:
-            preference = UserNotificationPreference.objects.create(
-                user=notification.user,
-                email=notification.user.email,
-                email_enabled=True
-            )
-        
-        if preference.email_enabled:
-            email_service = EmailService()
-            success, message = email_service.send_email(
-                preference.email,
-                notification.subject,
-                notification.message,
-                notification.html_message
-            )
-            notification.status = 'sent' if success else 'failed'
-            notification.email_message = message
-        else:
-            notification.status = 'failed'
-        
-        notification.save()
+        # Saved as pending; the send_notifications worker sends it when due
+        serializer.save(user=self.request.user)
 
     @action(detail=False, methods=['post'])
     def send_test_email(self, request):
@@ -66,6 +40,7 @@ class UserNotificationPreferenceViewSet(viewsets.ModelViewSet):
     queryset = UserNotificationPreference.objects.all()
     serializer_class = UserNotificationPreferenceSerializer
     permission_classes = [IsAuthenticated]
+    cursor_ordering = ('id',)
 
     def get_queryset(self):
         return UserNotificationPreference.objects.filter(user=self.request.user)
\ No newline at end of file
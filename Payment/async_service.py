@@ -0,0 +1,104 @@
+import time
+
+import httpx
+from django.conf import settings
+from django.core.cache import cache
+
+from easybook.async_views import run_sync
+from .circuit_breaker import CircuitOpen
+from .models import Payout, Transaction
+from .payment_service import (
+    DEFAULT_INITIALIZE_TIMEOUT, PaymentUnavailable, PaystackService, prepare_intent, record_initialization,
+    release_intent, subaccount_cache_key, subaccount_ttl,
+)
+from .paystack_client import RETRY_STATUSES, get_async_client
+
+
+def is_paid(reference):
+    return Transaction.objects.filter(paystack_reference=reference, status=Transaction.STATUS_SUCCESSFUL).exists()
+
+
+def confirm_payment(reference):
+    """Confirm a payment Paystack reported; False when it came too late to keep its seat"""
+    PaystackService().confirm_transaction(reference)
+    return is_paid(reference)
+
+
+class AsyncPaystackService:
+    """
+    PaystackService for async views. HTTP calls go through the event loop's
+    pooled httpx client, so one ASGI worker can keep many Paystack calls in
+    flight. Database work is the sync code of PaystackService, each step in
+    one run_sync call and none of it open while Paystack is awaited.
+    Objects passed in must have the related rows the payloads need loaded.
+    """
+
+    def __init__(self):
+        self.client = get_async_client()
+
+    async def verify_subaccount(self, subaccount_code):
+        """Retrieve and verify a Paystack subaccount by its code"""
+        response = await self.client.get(f"subaccount/{subaccount_code}", endpoint="subaccount/:code")
+        response_data = response.json()
+
+        if response.status_code == 200 and response_data.get('status') is True:
+            await cache.aset(
+                subaccount_cache_key(subaccount_code),
+                {'active': bool(response_data['data'].get('active')), 'checked_at': time.time()},
+                subaccount_ttl(),
+            )
+            return response_data['data']
+        raise Exception(response_data.get('message', 'Subaccount verification failed'))
+
+    async def initialize_payment(self, appointment, email, amount):
+        """
+        PaystackService.initialize_payment without blocking the loop: the
+        intent is claimed, Paystack awaited, then the result recorded, or
+        the claim released if the call failed.
+        """
+        intent, claimed = await run_sync(prepare_intent)(appointment, amount)
+        if not claimed:
+            return intent.authorization_url
+
+        payload = PaystackService.initialize_payload(intent, appointment, email)
+        try:
+            try:
+                response = await self.client.post(
+                    "transaction/initialize",
+                    json=payload,
+                    timeout=getattr(settings, 'PAYSTACK_INITIALIZE_TIMEOUT', DEFAULT_INITIALIZE_TIMEOUT),
+                )
+            except (CircuitOpen, httpx.TransportError) as exc:
+                # The intent stays queued for retry_payment_intents
+                raise PaymentUnavailable(str(exc)) from exc
+            if response.status_code in RETRY_STATUSES:
+                raise PaymentUnavailable(f"Paystack answered {response.status_code}")
+            if response.status_code != 200:
+                raise Exception("Failed to initialize payment")
+        except Exception:
+            await run_sync(release_intent)(intent)
+            raise
+        await run_sync(record_initialization)(intent, appointment, response.json()['data'])
+        return intent.authorization_url
+
+    async def verify_payment(self, reference):
+        """Verify a payment status"""
+        if await run_sync(is_paid)(reference):
+            return True
+
+        response = await self.client.get(f"transaction/verify/{reference}", endpoint="transaction/verify/:reference")
+        if response.status_code == 200 and response.json()['data']['status'] == 'success':
+            # Conditional update + payout + seat in one transaction, off the loop
+            return await run_sync(confirm_payment)(reference)
+        return False
+
+    async def initiate_transfer(self, payout):
+        """Initiate transfer to business's mobile money account"""
+        response = await self.client.post("transfer", json=PaystackService.transfer_payload(payout))
+        if response.status_code == 200:
+            data = response.json()
+            payout.paystack_transfer_reference = data['data']['reference']
+            payout.status = Payout.STATUS_PROCESSED
+            await run_sync(payout.save)()
+            return True
+        return False
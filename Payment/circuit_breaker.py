@@ -0,0 +1,100 @@
+import time
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+
+DEFAULT_FAILURE_RATE = 0.5
+DEFAULT_MIN_CALLS = 10
+DEFAULT_SLOW_CALL_SECONDS = 5.0
+DEFAULT_WINDOW = 60
+DEFAULT_OPEN_SECONDS = 30
+
+
+class CircuitOpen(Exception):
+    """Raised instead of calling a service whose circuit is open"""
+
+
+class CircuitBreaker:
+    """
+    Stops calls to a failing service and lets one probe through after a
+    cool-down. Calls are counted per fixed window; once at least min_calls
+    were made and the share of failed or slow calls reaches failure_rate,
+    the circuit opens for open_seconds. The next call after that is the
+    only one allowed through (half-open): its success closes the circuit,
+    its failure opens it again.
+
+    State lives in the Django cache, so workers sharing a Redis cache
+    share one circuit; with the local-memory cache each process has its own.
+    """
+
+    def __init__(self, name, failure_rate=DEFAULT_FAILURE_RATE, min_calls=DEFAULT_MIN_CALLS,
+                 slow_call_seconds=DEFAULT_SLOW_CALL_SECONDS, window=DEFAULT_WINDOW,
+                 open_seconds=DEFAULT_OPEN_SECONDS):
+        self.name = name
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.slow_call_seconds = slow_call_seconds
+        self.window = window
+        self.open_seconds = open_seconds
+
+    def _key(self, suffix):
+        return f"circuit:{self.name}:{suffix}"
+
+    def _incr(self, suffix):
+        key = self._key(suffix)
+        cache.add(key, 0, timeout=self.window * 2)
+        try:
+            return cache.incr(key)
+        except ValueError:
+            # Expired between add and incr
+            cache.add(key, 1, timeout=self.window * 2)
+            return 1
+
+    def before_call(self):
+        """Raise CircuitOpen, or return whether this call is the half-open probe"""
+        opened_at = cache.get(self._key("opened_at"))
+        if opened_at is None:
+            return False
+        if time.time() - opened_at < self.open_seconds:
+            raise CircuitOpen(f"{self.name} is unavailable")
+        # One probe at a time across all workers; expires if its worker dies
+        if cache.add(self._key("probe"), 1, timeout=self.open_seconds):
+            return True
+        raise CircuitOpen(f"{self.name} is being probed")
+
+    def after_call(self, probe, seconds, failed):
+        """Record the outcome of a call allowed by before_call"""
+        failed = failed or seconds >= self.slow_call_seconds
+        if probe:
+            if failed:
+                self.open()
+            else:
+                self.close()
+            return
+
+        bucket = int(time.time() // self.window)
+        calls = self._incr(f"{bucket}:calls")
+        if failed:
+            failures = self._incr(f"{bucket}:failures")
+            if calls >= self.min_calls and failures / calls >= self.failure_rate:
+                self.open()
+
+    def open(self):
+        cache.set(self._key("opened_at"), time.time(), timeout=None)
+        cache.delete(self._key("probe"))
+
+    def close(self):
+        bucket = int(time.time() // self.window)
+        cache.delete_many([
+            self._key("opened_at"),
+            self._key("probe"),
+            self._key(f"{bucket}:calls"),
+            self._key(f"{bucket}:failures"),
+        ])
+
+    async def abefore_call(self):
+        return await sync_to_async(self.before_call, thread_sensitive=False)()
+
+    async def aafter_call(self, probe, seconds, failed):
+        await sync_to_async(self.after_call, thread_sensitive=False)(probe, seconds, failed)
+
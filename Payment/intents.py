@@ -0,0 +1,67 @@
+import logging
+from collections import Counter
+
+from django.utils import timezone
+
+from Appointments.models import Appointment
+from .circuit_breaker import CircuitOpen
+from .models import PaymentIntent, new_idempotency_key
+from .payment_service import INITIALIZE_LEASE, PaymentUnavailable, PaystackService, claim_intent
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 100
+
+
+def deferred_intents():
+    """
+    Intents of payment-pending bookings that still have no payment link,
+    however long Paystack has been down; their hold only starts once the
+    link exists. A fresh intent is left to the booking request creating it.
+    """
+    return PaymentIntent.objects.filter(
+        authorization_url='',
+        appointment__status=Appointment.STATUS_PAYMENT_PENDING,
+        created_at__lt=timezone.now() - INITIALIZE_LEASE,
+    )
+
+
+def initialize_deferred_intents(batch_size=BATCH_SIZE):
+    """
+    Initialize the Paystack transactions of deferred bookings, oldest first,
+    one claimed intent at a time. Stops as soon as Paystack is still
+    unavailable so a long outage is not hammered. Returns a Counter of
+    outcomes.
+    """
+    service = PaystackService()
+    outcome = Counter()
+    last_id = 0
+    while True:
+        ids = list(deferred_intents().filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return outcome
+        for intent_id in ids:
+            intent = (
+                deferred_intents()
+                .select_related('appointment__service__business', 'appointment__user')
+                .filter(id=intent_id).first()
+            )
+            if intent is None or not claim_intent(intent):
+                # No longer deferred, or being initialized by someone else
+                continue
+            try:
+                # The earlier attempt may have reached Paystack before timing
+                # out. Its link was never handed out, so a fresh reference
+                # cannot lead to a double charge and avoids a duplicate error.
+                intent.idempotency_key = new_idempotency_key()
+                intent.save(update_fields=['idempotency_key', 'updated_at'])
+                service._initialize_intent(intent, intent.appointment, intent.appointment.user.email)
+            except (PaymentUnavailable, CircuitOpen):
+                outcome['deferred'] += 1
+                return outcome
+            except Exception:
+                logger.exception("Could not initialize payment intent %s", intent_id)
+                outcome['failed'] += 1
+            else:
+                outcome['initialized'] += 1
+        last_id = ids[-1]
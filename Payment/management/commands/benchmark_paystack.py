@@ -0,0 +1,187 @@
+import asyncio
+import json
+import os
+import shutil
+import socket
+import subprocess
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from Appointments.models import Appointment, TimeSlot
+from Notifications.models import Notification
+from Services.models import Service
+
+FIXTURE_EMAIL = 'benchmark-paystack-{}@example.invalid'
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def fake_paystack(latency):
+    """
+    A local stand-in for Paystack that answers every verification after
+    latency seconds with an abandoned payment, so each verify request makes
+    the round trip and marks its appointment failed.
+    """
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            time.sleep(latency)
+            body = json.dumps({'status': True, 'data': {'status': 'abandoned'}}).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', free_port()), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare payment verification under gunicorn gthread (WSGI) and "
+        "uvicorn (ASGI) against a local fake Paystack. Fixtures are written to "
+        "the configured database, since the servers run in their own "
+        "processes, and deleted at the end."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=1000, help="Verify requests sent to each server")
+        parser.add_argument('--concurrency', type=int, default=200, help="Requests in flight at once")
+        parser.add_argument('--latency', type=float, default=0.1, help="Seconds the fake Paystack takes to answer")
+        parser.add_argument('--threads', type=int, default=16, help="Threads of the gunicorn worker")
+
+    def handle(self, *args, **options):
+        for program in ('gunicorn', 'uvicorn'):
+            if shutil.which(program) is None:
+                raise CommandError(f"{program} is not installed")
+
+        self.delete_fixtures()
+        paystack = fake_paystack(options['latency'])
+        try:
+            customer, appointments = self.create_fixtures(options['requests'])
+            token = str(RefreshToken.for_user(customer).access_token)
+            servers = [
+                ("gunicorn gthread (WSGI)", 'verify_payment', [
+                    'gunicorn', 'easybook.wsgi:application', '--worker-class', 'gthread',
+                    '--workers', '1', '--threads', str(options['threads']), '--log-level', 'warning',
+                ], '--bind=127.0.0.1:{}'),
+                ("uvicorn (ASGI)", 'verify_payment_async', [
+                    'uvicorn', 'easybook.asgi:application', '--workers', '1', '--no-access-log',
+                    '--log-level', 'warning',
+                ], '--port={}'),
+            ]
+            for label, url_name, command, bind in servers:
+                port = free_port()
+                env = dict(os.environ, PAYSTACK_BASE_URL=f'http://127.0.0.1:{paystack.server_port}')
+                # Django logs every 400 of the failed verifications
+                process = subprocess.Popen(command + [bind.format(port)], env=env, stderr=subprocess.DEVNULL)
+                try:
+                    self.wait_for(port, process)
+                    paths = [reverse(url_name, args=[appointment.pk]) for appointment in appointments]
+                    elapsed, statuses = asyncio.run(self.drive(port, paths, token, options['concurrency']))
+                finally:
+                    process.terminate()
+                    process.wait()
+                # Every verification fails against the fake, so the same fixtures serve both runs
+                self.stdout.write(
+                    f"{label}: {len(paths)} request(s) in {elapsed:.2f} s, {len(paths) / elapsed:.0f} req/s, "
+                    f"statuses {dict(statuses)}"
+                )
+        finally:
+            paystack.shutdown()
+            self.delete_fixtures()
+
+    def create_fixtures(self, count):
+        """A customer with count appointments, each on its own slot"""
+        User = get_user_model()
+        business = User.objects.create_user(
+            email=FIXTURE_EMAIL.format('business'), first_name='Benchmark', last_name='Business', is_business=True,
+        )
+        customer = User.objects.create_user(
+            email=FIXTURE_EMAIL.format('customer'), first_name='Benchmark', last_name='Customer',
+        )
+        service = Service.objects.create(business=business, name='Benchmark')
+        day = timezone.localdate() + timedelta(days=2)
+        slots = []
+        for number in range(count):
+            start = datetime.combine(day, datetime.min.time()) + timedelta(minutes=number)
+            end = start + timedelta(minutes=1)
+            start_at, end_at = TimeSlot.bounds(day, start.time(), end.time())
+            slots.append(TimeSlot(
+                business=business, date=day, start_time=start.time(), end_time=end.time(),
+                start_at=start_at, end_at=end_at, booked_count=1,
+            ))
+        slots = TimeSlot.objects.bulk_create(slots, batch_size=1000)
+        appointments = Appointment.objects.bulk_create(
+            [Appointment(user=customer, timeslot=slot, service=service) for slot in slots], batch_size=1000,
+        )
+        return customer, appointments
+
+    def delete_fixtures(self):
+        User = get_user_model()
+        with transaction.atomic():
+            users = list(User.objects.filter(
+                email__in=[FIXTURE_EMAIL.format(role) for role in ('business', 'customer')],
+            ).values_list('pk', flat=True))
+            User.objects.filter(pk__in=users).delete()
+            # Deleting the appointments queued cancellation emails to the deleted customer
+            Notification.objects.filter(user_id__in=users).delete()
+
+    def wait_for(self, port, process, timeout=30):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise CommandError(f"{process.args[0]} exited with status {process.returncode}")
+            try:
+                socket.create_connection(('127.0.0.1', port), timeout=1).close()
+                return
+            except OSError:
+                time.sleep(0.1)
+        raise CommandError(f"{process.args[0]} did not start listening within {timeout} s")
+
+    async def drive(self, port, paths, token, concurrency):
+        """Send every path once, concurrency at a time. Returns the seconds taken and the status counts"""
+        statuses = Counter()
+        semaphore = asyncio.Semaphore(concurrency)
+        # A connection per request: gunicorn closes idle keep-alive connections
+        # a client could otherwise pick up just as they are dropped
+        limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=0)
+        async with httpx.AsyncClient(
+            base_url=f'http://127.0.0.1:{port}', limits=limits, timeout=60,
+            headers={'Authorization': f'Bearer {token}'},
+        ) as client:
+            async def verify(path):
+                async with semaphore:
+                    try:
+                        response = await client.get(path, params={'reference': f'benchmark-{path.split("/")[-2]}'})
+                    except httpx.TransportError as exc:
+                        statuses[type(exc).__name__] += 1
+                    else:
+                        statuses[response.status_code] += 1
+
+            started = time.perf_counter()
+            await asyncio.gather(*(verify(path) for path in paths))
+            elapsed = time.perf_counter() - started
+        return elapsed, statuses
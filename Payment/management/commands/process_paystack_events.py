@@ -0,0 +1,21 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from Payment.webhooks import process_pending_events
+
+
+class Command(BaseCommand):
+    help = "Apply Paystack webhook events stored by the webhook endpoint"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help="Keep running, polling every --interval seconds")
+        parser.add_argument('--interval', type=int, default=5, help="Seconds between polls in --loop mode")
+
+    def handle(self, *args, **options):
+        while True:
+            handled = process_pending_events()
+            self.stdout.write(f"Processed {handled} Paystack event(s)")
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,29 @@
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from Payment.revenue import rebuild_revenue
+
+
+class Command(BaseCommand):
+    help = "Recompute the daily business revenue rollups from payouts"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from', dest='date_from', help="First day (YYYY-MM-DD); defaults to 30 days ago")
+        parser.add_argument('--to', dest='date_to', help="Last day (YYYY-MM-DD), inclusive; defaults to yesterday")
+
+    def handle(self, *args, **options):
+        # Today is still being written by live confirmations, so it is left
+        # out unless asked for explicitly
+        yesterday = timezone.localdate() - timedelta(days=1)
+        try:
+            date_to = datetime.strptime(options['date_to'], '%Y-%m-%d').date() if options['date_to'] else yesterday
+            date_from = datetime.strptime(options['date_from'], '%Y-%m-%d').date() if options['date_from'] else date_to - timedelta(days=29)
+        except ValueError as exc:
+            raise CommandError(str(exc))
+        if date_from > date_to:
+            raise CommandError("--from must not be after --to")
+
+        written = rebuild_revenue(date_from, date_to)
+        self.stdout.write(f"Rebuilt revenue for {date_from} to {date_to}: {written} business day(s)")
@@ -0,0 +1,37 @@
+from datetime import datetime, time, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from Payment.reconciliation import reconcile_transactions
+
+
+class Command(BaseCommand):
+    help = "Fix pending transactions that Paystack reports as succeeded or failed"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from', dest='date_from', help="Start date (YYYY-MM-DD); defaults to two days ago")
+        parser.add_argument('--to', dest='date_to', help="End date (YYYY-MM-DD), inclusive; defaults to today")
+        parser.add_argument('--per-page', type=int, default=100, help="Transactions requested from Paystack per page")
+
+    def handle(self, *args, **options):
+        today = timezone.localdate()
+        try:
+            date_from = datetime.strptime(options['date_from'], '%Y-%m-%d').date() if options['date_from'] else today - timedelta(days=2)
+            date_to = datetime.strptime(options['date_to'], '%Y-%m-%d').date() if options['date_to'] else today
+        except ValueError as exc:
+            raise CommandError(str(exc))
+        if date_from > date_to:
+            raise CommandError("--from must not be after --to")
+
+        tz = timezone.get_default_timezone()
+        totals = reconcile_transactions(
+            timezone.make_aware(datetime.combine(date_from, time.min), tz),
+            timezone.make_aware(datetime.combine(date_to + timedelta(days=1), time.min), tz),
+            per_page=options['per_page'],
+        )
+        self.stdout.write(
+            f"Checked {totals['seen']} Paystack transaction(s): {totals['succeeded']} confirmed, "
+            f"{totals['failed']} failed, {totals['amount_mismatch']} amount mismatch(es), "
+            f"{totals['refund_required']} paid without a seat (refund required)"
+        )
@@ -0,0 +1,58 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+
+from Payment.payment_service import PaystackService, subaccount_cache_key, subaccount_ttl
+
+CHUNK_SIZE = 200
+
+
+class Command(BaseCommand):
+    help = "Re-verify Paystack subaccounts whose cached verification is missing or about to expire"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--margin', type=int, default=300,
+                            help="Refresh entries expiring within this many seconds")
+        parser.add_argument('--loop', action='store_true', help="Keep running, refreshing every --interval seconds")
+        parser.add_argument('--interval', type=int, default=120, help="Seconds between runs in --loop mode")
+
+    def handle(self, *args, **options):
+        while True:
+            refreshed = self.refresh(options['margin'])
+            self.stdout.write(f"Refreshed {refreshed} subaccount verification(s)")
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+    def refresh(self, margin):
+        service = PaystackService()
+        ttl = subaccount_ttl()
+        businesses = (
+            get_user_model().objects.filter(is_business=True, paystack_subaccount_code__gt='')
+            .only('id', 'paystack_subaccount_code', 'paystack_subaccount_active')
+            .order_by('id')
+        )
+        refreshed = 0
+        chunk = []
+        for business in businesses.iterator(chunk_size=CHUNK_SIZE):
+            chunk.append(business)
+            if len(chunk) == CHUNK_SIZE:
+                refreshed += self.refresh_chunk(service, chunk, ttl, margin)
+                chunk = []
+        if chunk:
+            refreshed += self.refresh_chunk(service, chunk, ttl, margin)
+        return refreshed
+
+    def refresh_chunk(self, service, businesses, ttl, margin):
+        # One cache round trip per chunk
+        cached = cache.get_many([subaccount_cache_key(b.paystack_subaccount_code) for b in businesses])
+        now = time.time()
+        refreshed = 0
+        for business in businesses:
+            entry = cached.get(subaccount_cache_key(business.paystack_subaccount_code))
+            if entry is None or entry['checked_at'] + ttl - now < margin:
+                service.refresh_subaccount(business)
+                refreshed += 1
+        return refreshed
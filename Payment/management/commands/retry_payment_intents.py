@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from Payment.intents import initialize_deferred_intents
+
+
+class Command(BaseCommand):
+    help = "Initialize Paystack payments for bookings accepted while Paystack was unavailable"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help="Keep running, polling every --interval seconds")
+        parser.add_argument('--interval', type=int, default=15, help="Seconds between polls in --loop mode")
+
+    def handle(self, *args, **options):
+        while True:
+            outcome = initialize_deferred_intents()
+            self.stdout.write(
+                f"Initialized {outcome['initialized']} payment(s); {outcome['failed']} failed"
+                + (", Paystack still unavailable" if outcome['deferred'] else "")
+            )
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
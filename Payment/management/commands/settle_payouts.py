@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from Payment.settlement import BATCH_SIZE, settle_payouts
+
+
+class Command(BaseCommand):
+    help = "Send pending payouts to businesses through Paystack bulk transfers"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE,
+                            help="Payouts claimed from the database at a time")
+
+    def handle(self, *args, **options):
+        outcome = settle_payouts(options['batch_size'])
+        self.stdout.write(
+            f"Submitted {outcome['submitted']} payout(s); {outcome['rejected']} rejected, "
+            f"{outcome['deferred']} deferred while Paystack is unavailable, "
+            f"{outcome['unknown']} awaiting confirmation; {outcome['confirmed']} earlier transfer(s) confirmed"
+        )
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:37
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def check_duplicate_payouts(apps, schema_editor):
+    Payout = apps.get_model('Payment', 'Payout')
+    # Concurrent verifications could record a payment twice. Payouts are
+    # financial records that may already have been transferred, so they are
+    # listed for manual review instead of being deleted here.
+    duplicated = (
+        Payout.objects.values('transaction')
+        .annotate(total=Count('id'))
+        .filter(total__gt=1)
+        .values('transaction')
+    )
+    rows = list(
+        Payout.objects.filter(transaction__in=duplicated)
+        .order_by('transaction', 'id')
+        .values_list('transaction', 'id', 'status', 'amount', 'paystack_transfer_reference')
+    )
+    if rows:
+        listing = "\n".join(
+            f"  transaction {transaction_id}: payout {payout_id} ({status}, {amount}, transfer {reference or '-'})"
+            for transaction_id, payout_id, status, amount, reference in rows
+        )
+        raise RuntimeError(
+            "Cannot add unique_payout_per_transaction: these transactions have more than one payout. "
+            "Reconcile them by hand (refund or reverse the extra transfers, then delete the extra payouts) "
+            "and run migrate again.\n" + listing
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Payment', '0003_paystack_event'),
+    ]
+
+    operations = [
+        migrations.RunPython(check_duplicate_payouts, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='payout',
+            constraint=models.UniqueConstraint(fields=('transaction',), name='unique_payout_per_transaction'),
+        ),
+    ]
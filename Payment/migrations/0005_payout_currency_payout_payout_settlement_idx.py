@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:59
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Payment', '0004_unique_payout_per_transaction'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='payout',
+            name='currency',
+            field=models.CharField(default='GHS', max_length=3),
+        ),
+        migrations.AddIndex(
+            model_name='payout',
+            index=models.Index(fields=['status', 'currency', 'id'], name='payout_settlement_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Payment', '0006_businessdailyrevenue'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='transaction',
+            name='status',
+            field=models.CharField(choices=[('P', 'Pending'), ('S', 'Successful'), ('F', 'Failed'), ('R', 'Refund required')], default='P', max_length=1),
+        ),
+    ]
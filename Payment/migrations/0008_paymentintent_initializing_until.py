@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Payment', '0007_alter_transaction_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='paymentintent',
+            name='initializing_until',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -1,3 +1,4 @@
+import uuid
 from django.db import models
 from django.conf import settings
 from Appointments.models import Appointment
@@ -6,11 +7,15 @@ class Transaction(models.Model):
     STATUS_PENDING = 'P'
     STATUS_SUCCESSFUL = 'S'
     STATUS_FAILED = 'F'
+    # Paid after the hold lapsed and the timeslot was rebooked: no payout or
+    # revenue is recorded and the customer must be refunded
+    STATUS_REFUND_REQUIRED = 'R'
     
     STATUS_CHOICES = [
         (STATUS_PENDING, 'Pending'),
         (STATUS_SUCCESSFUL, 'Successful'),
         (STATUS_FAILED, 'Failed'),
+        (STATUS_REFUND_REQUIRED, 'Refund required'),
     ]
     
     appointment = models.ForeignKey(Appointment, on_delete=models.CASCADE, related_name='transactions')
@@ -39,9 +44,98 @@ class Payout(models.Model):
     amount = models.DecimalField(max_digits=10, decimal_places=2)  # Amount after platform fee
     platform_fee = models.DecimalField(max_digits=10, decimal_places=2)  # 5% of transaction amount
     status = models.CharField(max_length=1, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    currency = models.CharField(max_length=3, default='GHS')
     paystack_transfer_reference = models.CharField(max_length=100, unique=True, null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # Settlement picks pending payouts per currency
+            models.Index(fields=['status', 'currency', 'id'], name='payout_settlement_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['transaction'], name='unique_payout_per_transaction'),
+        ]
     
     def __str__(self):
         return f"Payout for {self.business} - {self.amount}"
+
+
+
+def new_idempotency_key():
+    return f"eb-{uuid.uuid4().hex}"
+
+
+class PaymentIntent(models.Model):
+    """
+    The single Paystack initialization of an appointment. Its idempotency
+    key is sent as the transaction reference, and the authorization URL is
+    kept so every later caller gets it without another Paystack call.
+    """
+    appointment = models.OneToOneField(Appointment, on_delete=models.CASCADE, related_name='payment_intent')
+    idempotency_key = models.CharField(max_length=100, unique=True, default=new_idempotency_key, editable=False)
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    # Empty until Paystack has initialized the transaction
+    authorization_url = models.URLField(max_length=500, blank=True)
+    transaction = models.OneToOneField(Transaction, on_delete=models.SET_NULL, null=True, blank=True, related_name='intent')
+    # Lease of the caller currently initializing the intent with Paystack
+    initializing_until = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Payment intent for {self.appointment} - {self.amount}"
+
+
+class PaystackEvent(models.Model):
+    """A webhook event from Paystack, stored as received and processed later"""
+    STATUS_PENDING = 'P'
+    STATUS_PROCESSED = 'S'
+    STATUS_FAILED = 'F'
+
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_PROCESSED, 'Processed'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    # Paystack redelivers events; this key makes a redelivery a no-op
+    event_id = models.CharField(max_length=150, unique=True)
+    event = models.CharField(max_length=100)
+    payload = models.JSONField()
+    status = models.CharField(max_length=1, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # The worker's queue: pending events in arrival order
+            models.Index(fields=['status', 'id'], name='paystack_event_queue_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.event} ({self.event_id})"
+
+
+class BusinessDailyRevenue(models.Model):
+    """
+    A business's earnings for one local day, kept up to date as transactions
+    succeed so dashboards read one row per day instead of every transaction
+    """
+    business = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='daily_revenue')
+    date = models.DateField()
+    gross = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    platform_fee = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    net = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    transaction_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['business', 'date'], name='unique_daily_revenue_per_business'),
+        ]
+
+    def __str__(self):
+        return f"Revenue of {self.business} on {self.date}"
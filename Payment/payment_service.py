@@ -1,33 +1,155 @@
+import logging
 import requests
+import time
+from datetime import timedelta
 from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction as db_transaction
+from django.db.models import Q
+from django.utils import timezone
 from decimal import Decimal
-from .models import Transaction, Payout
+from .models import Transaction, Payout, PaymentIntent
+from Appointments.models import Appointment, SlotFull
+from Notifications.models import Notification
+from .circuit_breaker import CircuitOpen
+from .paystack_client import RETRY_STATUSES, get_client
+from .revenue import record_revenue
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SUBACCOUNT_TTL = timedelta(minutes=30)
+DEFAULT_INITIALIZE_TIMEOUT = (3.05, 5)
+# How long one caller may spend initializing an intent before another may
+# take over; well above the initialize timeout
+INITIALIZE_LEASE = timedelta(seconds=30)
+
+
+class PaymentUnavailable(Exception):
+    """
+    Paystack could not be reached or is failing. The payment intent is kept
+    and initialized later by the retry_payment_intents command.
+    """
+
+
+def subaccount_cache_key(subaccount_code):
+    return f"paystack:subaccount:{subaccount_code}"
+
+
+def subaccount_ttl():
+    return getattr(settings, 'PAYSTACK_SUBACCOUNT_TTL', DEFAULT_SUBACCOUNT_TTL).total_seconds()
+
+
+def invalidate_subaccount(subaccount_code):
+    """Forget a cached verification so the next check asks Paystack"""
+    if subaccount_code:
+        cache.delete(subaccount_cache_key(subaccount_code))
+
+
+def claim_intent(intent):
+    """
+    Claim the initialization of an intent without a link, with one
+    conditional UPDATE committed at once. No row lock is held while Paystack
+    is called; a caller that dies mid-call blocks others only until its
+    lease runs out. Returns whether this caller holds the claim.
+    """
+    now = timezone.now()
+    return PaymentIntent.objects.filter(
+        Q(initializing_until__isnull=True) | Q(initializing_until__lt=now),
+        pk=intent.pk,
+        authorization_url='',
+    ).update(initializing_until=now + INITIALIZE_LEASE) == 1
+
+
+def prepare_intent(appointment, amount):
+    """
+    The payment intent of an appointment and whether this caller claimed its
+    initialization; not when it already has its link. Raises
+    PaymentUnavailable while another caller is initializing it.
+    """
+    intent, _ = PaymentIntent.objects.get_or_create(appointment=appointment, defaults={'amount': amount})
+    if intent.authorization_url:
+        return intent, False
+    if claim_intent(intent):
+        return intent, True
+    intent.refresh_from_db(fields=['authorization_url'])
+    if not intent.authorization_url:
+        raise PaymentUnavailable("The payment is being initialized by another request")
+    return intent, False
+
+
+def release_intent(intent):
+    """Give up a claim after a failed initialization so the next attempt may run"""
+    PaymentIntent.objects.filter(pk=intent.pk).update(initializing_until=None)
+
+
+def record_initialization(intent, appointment, data):
+    """
+    Store the transaction and link Paystack returned for a claimed intent,
+    and bring forward the booking email that was waiting for the link
+    """
+    with db_transaction.atomic():
+        intent.transaction, _ = Transaction.objects.get_or_create(
+            paystack_reference=data['reference'],
+            defaults={'appointment': appointment, 'amount': intent.amount},
+        )
+        intent.authorization_url = data['authorization_url']
+        intent.initializing_until = None
+        intent.save(update_fields=['transaction', 'authorization_url', 'initializing_until', 'updated_at'])
+        Notification.objects.filter(
+            appointment=appointment, template_key='appointment_created', status='pending',
+            scheduled_at__gt=timezone.now(),
+        ).update(scheduled_at=timezone.now())
+
 
 class PaystackService:
     def __init__(self):
-        self.secret_key = settings.PAYSTACK_SECRET_KEY
-        self.base_url = "https://api.paystack.co"
-        self.headers = {
-            "Authorization": f"Bearer {self.secret_key}",
-            "Content-Type": "application/json"
-        }
+        # Pooled keep-alive connections shared by every service instance
+        self.client = get_client()
 
     def verify_subaccount(self, subaccount_code):
         """Retrieve and verify a Paystack subaccount by its code"""
-        url = f"{self.base_url}/subaccount/{subaccount_code}"
-        
-        response = requests.get(url, headers=self.headers)
+        response = self.client.get(f"subaccount/{subaccount_code}", endpoint="subaccount/:code")
         response_data = response.json()
 
         if response.status_code == 200 and response_data.get('status') is True:
+            # Every live answer refreshes the shared cache
+            cache.set(
+                subaccount_cache_key(subaccount_code),
+                {'active': bool(response_data['data'].get('active')), 'checked_at': time.time()},
+                subaccount_ttl(),
+            )
             return response_data['data']  # Verified details
         else:
             raise Exception(response_data.get('message', 'Subaccount verification failed'))
 
+    def is_subaccount_active(self, business):
+        """
+        Whether a business can take payments, answered from the shared cache
+        and only verified with Paystack when the cached result has expired.
+        If Paystack cannot be reached the stored flag is used.
+        """
+        code = business.paystack_subaccount_code
+        if not code:
+            return False
+        cached = cache.get(subaccount_cache_key(code))
+        if cached is not None:
+            return cached['active']
+        return self.refresh_subaccount(business)
+
+    def refresh_subaccount(self, business):
+        """Verify a business's subaccount now, caching the result and syncing the stored flag"""
+        try:
+            active = bool(self.verify_subaccount(business.paystack_subaccount_code).get('active'))
+        except Exception:
+            return business.paystack_subaccount_active
+        if active != business.paystack_subaccount_active:
+            get_user_model().objects.filter(pk=business.pk).update(paystack_subaccount_active=active)
+            business.paystack_subaccount_active = active
+        return active
+
     def create_subaccount(self, business, business_name, phone_number, mobile_money_network):
         """Create or verify a Paystack subaccount for a business with mobile money"""
-        url = f"{self.base_url}/subaccount"
-        
         PLATFORM_FEE = 5.0
 
         if not business.business_email:
@@ -47,6 +169,9 @@ class PaystackService:
 
         settlement_bank = provider_codes[network]
 
+        # A setup attempt always re-checks Paystack
+        invalidate_subaccount(business.paystack_subaccount_code)
+
         # ✅ PREVENT DUPLICATE CREATION
         if business.paystack_subaccount_code:
             try:
@@ -76,7 +201,7 @@ class PaystackService:
         }
 
         try:
-            response = requests.post(url, headers=self.headers, json=payload)
+            response = self.client.post("subaccount", json=payload)
             response_data = response.json()
 
             # ✅ CASE 1: Successfully created
@@ -120,12 +245,28 @@ class PaystackService:
             raise Exception(f"Failed to create subaccount: {str(e)}")
 
     def initialize_payment(self, appointment, email, amount):
-        """Initialize a payment and return the payment URL"""
-        url = f"{self.base_url}/transaction/initialize"
+        """
+        Return the payment URL of an appointment, initializing the Paystack
+        transaction only the first time. Initialization is claimed and the
+        claim committed before Paystack is called, then the result is
+        recorded in a short transaction of its own. Raises PaymentUnavailable,
+        leaving the intent queued for retry_payment_intents, when Paystack is
+        down or another caller is initializing the intent right now.
+        """
+        intent, claimed = prepare_intent(appointment, amount)
+        if claimed:
+            self._initialize_intent(intent, appointment, email)
+        return intent.authorization_url
+
+    @staticmethod
+    def initialize_payload(intent, appointment, email):
+        """Body of transaction/initialize; needs appointment.service.business loaded"""
+        amount = intent.amount
         callback_url = f"{settings.BASE_URL}/payment/verify/{appointment.id}/"
         
-        payload = {
+        return {
             "email": email,
+            "reference": intent.idempotency_key,
             "amount": int(amount * 100),  # Paystack expects amount in kobo/pesewas
             "currency": "GHS",
             "callback_url": callback_url,
@@ -136,64 +277,176 @@ class PaystackService:
                 "appointment_id": str(appointment.id)
             }
         }
-        
-        response = requests.post(url, headers=self.headers, json=payload)
-        if response.status_code == 200:
-            data = response.json()
-            # Create transaction record
-            Transaction.objects.create(
-                appointment=appointment,
-                amount=amount,
-                paystack_reference=data['data']['reference']
-            )
-            return data['data']['authorization_url']
-        raise Exception("Failed to initialize payment")
+
+    def _initialize_intent(self, intent, appointment, email):
+        """Initialize a claimed intent with Paystack; the claim is released if it fails"""
+        payload = self.initialize_payload(intent, appointment, email)
+        try:
+            try:
+                response = self.client.post(
+                    "transaction/initialize",
+                    json=payload,
+                    timeout=getattr(settings, 'PAYSTACK_INITIALIZE_TIMEOUT', DEFAULT_INITIALIZE_TIMEOUT),
+                )
+            except (CircuitOpen, requests.exceptions.RequestException) as exc:
+                raise PaymentUnavailable(str(exc)) from exc
+            if response.status_code in RETRY_STATUSES:
+                raise PaymentUnavailable(f"Paystack answered {response.status_code}")
+            if response.status_code != 200:
+                raise Exception("Failed to initialize payment")
+        except Exception:
+            release_intent(intent)
+            raise
+        record_initialization(intent, appointment, response.json()['data'])
 
     def verify_payment(self, reference):
         """Verify a payment status"""
-        url = f"{self.base_url}/transaction/verify/{reference}"
-        response = requests.get(url, headers=self.headers)
+        # A reference already recorded as paid needs no round trip to Paystack
+        if Transaction.objects.filter(paystack_reference=reference, status=Transaction.STATUS_SUCCESSFUL).exists():
+            return True
+
+        response = self.client.get(f"transaction/verify/{reference}", endpoint="transaction/verify/:reference")
         
         if response.status_code == 200:
             data = response.json()
             if data['data']['status'] == 'success':
-                # Update transaction status
-                transaction = Transaction.objects.get(paystack_reference=reference)
-                transaction.status = Transaction.STATUS_SUCCESSFUL
-                transaction.save()
-                
-                # Create payout record (now handled automatically by Paystack)
-                self._create_payout(transaction)
-                return True
+                self.confirm_transaction(reference)
+                # False when the payment came too late to keep its seat
+                return Transaction.objects.filter(
+                    paystack_reference=reference,
+                    status=Transaction.STATUS_SUCCESSFUL,
+                ).exists()
         return False
 
+    def list_transactions(self, date_from, date_to, per_page=100):
+        """
+        Yield Paystack's transactions created between date_from and date_to
+        one page at a time, so callers never hold more than a page.
+        """
+        page = 1
+        while True:
+            response = self.client.get("transaction", params={
+                "from": date_from.isoformat(),
+                "to": date_to.isoformat(),
+                "perPage": per_page,
+                "page": page,
+            })
+            if response.status_code != 200:
+                raise Exception(f"Failed to list transactions: {response.text[:200]}")
+            body = response.json()
+            if not body.get('data'):
+                return
+            yield body['data']
+            if page >= (body.get('meta') or {}).get('pageCount', page):
+                return
+            page += 1
+
+    def confirm_transaction(self, reference):
+        """
+        Record a payment Paystack reported as successful, from the verify
+        redirect or the charge.success webhook: mark the transaction
+        successful, confirm the appointment and create its payout.
+
+        The status change is one conditional UPDATE on a pending row, so when
+        a redirect and a webhook race only the caller that flips it does the
+        rest. A payment whose seat was rebooked after its hold lapsed is
+        marked refund required instead, without a payout. Returns the
+        transaction, or None if it was not pending.
+        """
+        with db_transaction.atomic():
+            claimed = Transaction.objects.filter(
+                paystack_reference=reference,
+                status=Transaction.STATUS_PENDING,
+            ).update(status=Transaction.STATUS_SUCCESSFUL, updated_at=timezone.now())
+            if not claimed:
+                return None
+            transaction = Transaction.objects.select_related('appointment__service').get(paystack_reference=reference)
+
+            appointment = transaction.appointment
+            appointment.status = Appointment.STATUS_CONFIRMED
+            try:
+                with db_transaction.atomic():
+                    appointment.save()
+            except SlotFull:
+                self.require_refund([transaction])
+                return transaction
+
+            # Create payout record (now handled automatically by Paystack)
+            self._create_payout(transaction)
+        return transaction
+
+    @staticmethod
+    def require_refund(transactions):
+        """Mark paid transactions whose appointment lost its seat as needing a refund"""
+        for transaction in transactions:
+            transaction.status = Transaction.STATUS_REFUND_REQUIRED
+            logger.warning(
+                "Appointment %s was paid after its timeslot was rebooked; refund required for %s",
+                transaction.appointment_id, transaction.paystack_reference,
+            )
+        Transaction.objects.filter(pk__in=[transaction.pk for transaction in transactions]).update(
+            status=Transaction.STATUS_REFUND_REQUIRED,
+            updated_at=timezone.now(),
+        )
+
     def _create_payout(self, transaction):
-        """Create a payout record for tracking"""
+        """Create a payout record for tracking and add it to the revenue rollup"""
+        payout = self.build_payout(transaction)
+        # unique_payout_per_transaction makes a second payout impossible
+        Payout.objects.bulk_create([payout], ignore_conflicts=True)
+        record_revenue([payout])
+
+    @staticmethod
+    def build_payout(transaction):
+        """Unsaved payout of a successful transaction; needs appointment.service loaded"""
         amount = transaction.amount
         platform_fee = amount * Decimal('0.05')  # 5% platform fee
         business_amount = amount - platform_fee
-        
-        Payout.objects.create(
-            business=transaction.appointment.service.business,
+        return Payout(
+            business_id=transaction.appointment.service.business_id,
             transaction=transaction,
             amount=business_amount,
             platform_fee=platform_fee,
             status=Payout.STATUS_PROCESSED  # Mark as processed since Paystack handles the split
         )
 
-    def initiate_transfer(self, payout):
-        """Initiate transfer to business's mobile money account"""
-        url = f"{self.base_url}/transfer"
-        
-        payload = {
+    @staticmethod
+    def transfer_payload(payout):
+        """Body of a transfer; needs payout.business and payout.transaction loaded"""
+        return {
             "source": "balance",
             "amount": int(payout.amount * 100),  # Convert to kobo/pesewas
-            "currency": "GHS",
+            "currency": payout.currency,
             "recipient": payout.business.paystack_recipient_code,  # Business needs to have this set up
-            "reason": f"Payment for appointment {payout.transaction.appointment.id}"
+            "reason": f"Payment for appointment {payout.transaction.appointment_id}"
         }
-        
-        response = requests.post(url, headers=self.headers, json=payload)
+
+    def bulk_transfer(self, currency, payouts):
+        """
+        Queue transfers for payouts of one currency in a single call. Each
+        payout must already carry its paystack_transfer_reference, so a
+        resend can never pay twice. Returns the response.
+        """
+        transfers = []
+        for payout in payouts:
+            item = self.transfer_payload(payout)
+            del item["source"], item["currency"]
+            item["reference"] = payout.paystack_transfer_reference
+            transfers.append(item)
+        return self.client.post("transfer/bulk", json={
+            "currency": currency,
+            "source": "balance",
+            "transfers": transfers,
+        })
+
+    def verify_transfer(self, reference):
+        """Paystack's record of the transfer sent under a reference. Returns the response."""
+        return self.client.get(f"transfer/verify/{reference}", endpoint="transfer/verify/:reference")
+
+    def initiate_transfer(self, payout):
+        """Initiate transfer to business's mobile money account"""
+        payload = self.transfer_payload(payout)
+        response = self.client.post("transfer", json=payload)
         if response.status_code == 200:
             data = response.json()
             payout.paystack_transfer_reference = data['data']['reference']
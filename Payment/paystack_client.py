@@ -0,0 +1,282 @@
+import asyncio
+import os
+import random
+import threading
+import time
+import weakref
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+
+from . import circuit_breaker
+from .circuit_breaker import CircuitBreaker
+
+DEFAULT_BASE_URL = "https://api.paystack.co"
+# (connect, read) seconds; a hung Paystack call must not pin a worker
+DEFAULT_TIMEOUT = (3.05, 15)
+DEFAULT_MAX_RETRIES = 2
+DEFAULT_POOL_SIZE = 10
+
+# Responses worth retrying on an idempotent call
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+BACKOFF_BASE = 0.25
+BACKOFF_CAP = 2.0
+
+
+class EndpointStats:
+    __slots__ = ("calls", "errors", "retries", "total_seconds", "max_seconds")
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.retries = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+
+    def as_dict(self):
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "retries": self.retries,
+            "avg_ms": round(self.total_seconds * 1000 / self.calls, 2) if self.calls else 0.0,
+            "max_ms": round(self.max_seconds * 1000, 2),
+        }
+
+
+def backoff_delay(attempt):
+    # Full jitter keeps workers that failed together from retrying together
+    return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+
+
+class EndpointCounters:
+    """Per-endpoint latency and error counters shared by the sync and async clients"""
+
+    def __init__(self):
+        self._stats = {}
+        self._stats_lock = threading.Lock()
+
+    def _record(self, key, seconds, error, retry):
+        with self._stats_lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                stats = self._stats[key] = EndpointStats()
+            stats.calls += 1
+            stats.errors += error
+            stats.retries += retry
+            stats.total_seconds += seconds
+            stats.max_seconds = max(stats.max_seconds, seconds)
+
+    def stats(self):
+        """Snapshot of the per-endpoint counters of this process"""
+        with self._stats_lock:
+            return {key: stats.as_dict() for key, stats in self._stats.items()}
+
+
+def auth_headers(secret_key):
+    return {
+        "Authorization": f"Bearer {secret_key}",
+        "Content-Type": "application/json",
+    }
+
+
+class PaystackClient(EndpointCounters):
+    """
+    Keep-alive HTTP client for the Paystack API, shared by every
+    PaystackService in the process. Each call has connect/read timeouts;
+    idempotent calls (GET by default) are retried with jittered exponential
+    backoff on network errors and 429/5xx responses. Latency and error
+    counters are kept per endpoint. Every call goes through the circuit
+    breaker, which raises CircuitOpen while Paystack is failing.
+    """
+
+    def __init__(self, secret_key, base_url=DEFAULT_BASE_URL, timeout=DEFAULT_TIMEOUT,
+                 max_retries=DEFAULT_MAX_RETRIES, pool_size=DEFAULT_POOL_SIZE, breaker=None):
+        super().__init__()
+        self.breaker = breaker or CircuitBreaker("paystack")
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.session = requests.Session()
+        self.session.headers.update(auth_headers(secret_key))
+        # Retries are done here, not by urllib3, so they can be counted
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def get(self, path, endpoint=None, **kwargs):
+        return self.request("GET", path, endpoint=endpoint, **kwargs)
+
+    def post(self, path, endpoint=None, **kwargs):
+        return self.request("POST", path, endpoint=endpoint, **kwargs)
+
+    def request(self, method, path, endpoint=None, idempotent=None, **kwargs):
+        """
+        Send a request to base_url/path. `endpoint` names the counter the
+        call is recorded under (defaults to the path, which should not carry
+        ids). Non-idempotent calls are only retried when the connection
+        could not be opened, since Paystack never saw them.
+        """
+        probe = self.breaker.before_call()
+        started = time.monotonic()
+        try:
+            response = self._send(method, path, endpoint, idempotent, **kwargs)
+        except requests.exceptions.RequestException:
+            self.breaker.after_call(probe, time.monotonic() - started, failed=True)
+            raise
+        self.breaker.after_call(probe, time.monotonic() - started, failed=response.status_code in RETRY_STATUSES)
+        return response
+
+    def _send(self, method, path, endpoint, idempotent, **kwargs):
+        if idempotent is None:
+            idempotent = method in ("GET", "HEAD")
+        kwargs.setdefault("timeout", self.timeout)
+        url = f"{self.base_url}/{path.lstrip('/')}"
+        key = f"{method} {endpoint or path}"
+
+        attempt = 0
+        while True:
+            started = time.monotonic()
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except requests.exceptions.RequestException as exc:
+                retry = attempt < self.max_retries and (
+                    idempotent or isinstance(exc, requests.exceptions.ConnectTimeout)
+                )
+                self._record(key, time.monotonic() - started, error=True, retry=retry)
+                if not retry:
+                    raise
+            else:
+                retry = idempotent and attempt < self.max_retries and response.status_code in RETRY_STATUSES
+                self._record(key, time.monotonic() - started, error=response.status_code >= 500, retry=retry)
+                if not retry:
+                    return response
+                response.close()
+            attempt += 1
+            time.sleep(backoff_delay(attempt))
+
+
+class AsyncPaystackClient(EndpointCounters):
+    """
+    The async counterpart of PaystackClient for ASGI deployments: one
+    httpx.AsyncClient connection pool per event loop, the same timeouts,
+    retry rules and counters.
+    """
+
+    def __init__(self, secret_key, base_url=DEFAULT_BASE_URL, timeout=DEFAULT_TIMEOUT,
+                 max_retries=DEFAULT_MAX_RETRIES, pool_size=DEFAULT_POOL_SIZE, breaker=None):
+        super().__init__()
+        self.breaker = breaker or CircuitBreaker("paystack")
+        connect, read = timeout
+        self.max_retries = max_retries
+        self.client = httpx.AsyncClient(
+            base_url=base_url.rstrip("/") + "/",
+            headers=auth_headers(secret_key),
+            timeout=httpx.Timeout(read, connect=connect),
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+        )
+
+    async def get(self, path, endpoint=None, **kwargs):
+        return await self.request("GET", path, endpoint=endpoint, **kwargs)
+
+    async def post(self, path, endpoint=None, **kwargs):
+        return await self.request("POST", path, endpoint=endpoint, **kwargs)
+
+    async def request(self, method, path, endpoint=None, idempotent=None, **kwargs):
+        """Same contract as PaystackClient.request, without blocking the event loop"""
+        probe = await self.breaker.abefore_call()
+        started = time.monotonic()
+        try:
+            response = await self._send(method, path, endpoint, idempotent, **kwargs)
+        except httpx.TransportError:
+            await self.breaker.aafter_call(probe, time.monotonic() - started, failed=True)
+            raise
+        await self.breaker.aafter_call(probe, time.monotonic() - started, failed=response.status_code in RETRY_STATUSES)
+        return response
+
+    async def _send(self, method, path, endpoint, idempotent, **kwargs):
+        if idempotent is None:
+            idempotent = method in ("GET", "HEAD")
+        if isinstance(kwargs.get("timeout"), tuple):
+            connect, read = kwargs["timeout"]
+            kwargs["timeout"] = httpx.Timeout(read, connect=connect)
+        key = f"{method} {endpoint or path}"
+
+        attempt = 0
+        while True:
+            started = time.monotonic()
+            try:
+                response = await self.client.request(method, path.lstrip("/"), **kwargs)
+            except httpx.TransportError as exc:
+                retry = attempt < self.max_retries and (
+                    idempotent or isinstance(exc, (httpx.ConnectError, httpx.ConnectTimeout))
+                )
+                self._record(key, time.monotonic() - started, error=True, retry=retry)
+                if not retry:
+                    raise
+            else:
+                retry = idempotent and attempt < self.max_retries and response.status_code in RETRY_STATUSES
+                self._record(key, time.monotonic() - started, error=response.status_code >= 500, retry=retry)
+                if not retry:
+                    return response
+            attempt += 1
+            await asyncio.sleep(backoff_delay(attempt))
+
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def client_options():
+    return dict(
+        base_url=getattr(settings, "PAYSTACK_BASE_URL", DEFAULT_BASE_URL),
+        timeout=getattr(settings, "PAYSTACK_TIMEOUT", DEFAULT_TIMEOUT),
+        max_retries=getattr(settings, "PAYSTACK_MAX_RETRIES", DEFAULT_MAX_RETRIES),
+        pool_size=getattr(settings, "PAYSTACK_POOL_SIZE", DEFAULT_POOL_SIZE),
+        breaker=paystack_breaker(),
+    )
+
+
+def paystack_breaker():
+    """The circuit breaker guarding Paystack calls, configured from settings"""
+    return CircuitBreaker(
+        "paystack",
+        failure_rate=getattr(settings, "PAYSTACK_BREAKER_FAILURE_RATE", circuit_breaker.DEFAULT_FAILURE_RATE),
+        min_calls=getattr(settings, "PAYSTACK_BREAKER_MIN_CALLS", circuit_breaker.DEFAULT_MIN_CALLS),
+        slow_call_seconds=getattr(settings, "PAYSTACK_BREAKER_SLOW_CALL_SECONDS", circuit_breaker.DEFAULT_SLOW_CALL_SECONDS),
+        window=getattr(settings, "PAYSTACK_BREAKER_WINDOW", circuit_breaker.DEFAULT_WINDOW),
+        open_seconds=getattr(settings, "PAYSTACK_BREAKER_OPEN_SECONDS", circuit_breaker.DEFAULT_OPEN_SECONDS),
+    )
+
+
+def get_client():
+    """
+    The process-wide client, built from settings on first use. A forked
+    worker builds its own so pooled sockets are never shared across processes.
+    """
+    global _client, _client_pid
+    pid = os.getpid()
+    if _client is None or _client_pid != pid:
+        with _client_lock:
+            if _client is None or _client_pid != pid:
+                _client = PaystackClient(settings.PAYSTACK_SECRET_KEY, **client_options())
+                _client_pid = pid
+    return _client
+
+
+def get_async_client():
+    """
+    The async client of the running event loop. httpx pools cannot be
+    shared between loops, so each loop (one per ASGI worker) gets its own.
+    """
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        options = client_options()
+        # Async workers keep many more calls in flight than threads do
+        options["pool_size"] = getattr(settings, "PAYSTACK_ASYNC_POOL_SIZE", options["pool_size"])
+        client = _async_clients[loop] = AsyncPaystackClient(settings.PAYSTACK_SECRET_KEY, **options)
+    return client
@@ -0,0 +1,120 @@
+import logging
+from collections import Counter
+
+from django.db import transaction
+from django.utils import timezone
+
+from Appointments.holds import fail_appointments, hold_cutoff
+from Appointments.models import Appointment, SlotFull
+from Notifications.models import Notification
+from .models import Payout, Transaction
+from .payment_service import PaystackService
+from .revenue import record_revenue
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 500
+# Paystack statuses that end a transaction without payment
+FAILED_STATUSES = {'failed', 'reversed'}
+
+
+def _chunks(items, size=BATCH_SIZE):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def reconcile_page(remote_page):
+    """
+    Correct local pending transactions from one page of Paystack's list.
+    Matching goes through a dict keyed by reference and the corrections are
+    applied set-wise. Rows locked by a concurrent confirmation are skipped.
+    Returns a Counter of outcomes.
+    """
+    remote = {item['reference']: item for item in remote_page if item.get('reference')}
+    outcome = Counter()
+    if not remote:
+        return outcome
+
+    with transaction.atomic():
+        pending = list(
+            Transaction.objects.select_for_update(of=('self',), skip_locked=True)
+            .select_related('appointment__service')
+            .filter(paystack_reference__in=remote.keys(), status=Transaction.STATUS_PENDING)
+        )
+        now = timezone.now()
+        succeeded, failed = [], []
+        for record in pending:
+            status = remote[record.paystack_reference].get('status')
+            if status == 'success':
+                if remote[record.paystack_reference].get('amount') != int(record.amount * 100):
+                    outcome['amount_mismatch'] += 1
+                    logger.warning("Amount mismatch on Paystack reference %s", record.paystack_reference)
+                    continue
+                record.status = Transaction.STATUS_SUCCESSFUL
+                succeeded.append(record)
+            elif status in FAILED_STATUSES or (status == 'abandoned' and record.created_at < hold_cutoff(now)):
+                record.status = Transaction.STATUS_FAILED
+                failed.append(record)
+            else:
+                continue
+            record.updated_at = now
+
+        for chunk in _chunks(succeeded + failed):
+            Transaction.objects.bulk_update(chunk, ['status', 'updated_at'])
+
+        if succeeded:
+            appointment_ids = [record.appointment_id for record in succeeded]
+            # Appointments still holding their seat are confirmed in one
+            # UPDATE, which skips post_save, so their update emails are
+            # inserted here in one statement
+            holding = list(
+                Appointment.objects.select_for_update(of=('self',))
+                .select_related('service', 'timeslot', 'pricing')
+                .filter(id__in=appointment_ids, status__in=[Appointment.STATUS_PENDING, Appointment.STATUS_PAYMENT_PENDING])
+            )
+            Appointment.objects.filter(id__in=[appointment.id for appointment in holding]).update(
+                status=Appointment.STATUS_CONFIRMED, updated_at=now,
+            )
+            Notification.objects.bulk_create(
+                [Notification.about_appointment(appointment) for appointment in holding], batch_size=BATCH_SIZE,
+            )
+            # Ones whose hold lapsed must win their seat back one at a time
+            without_seat = set()
+            for appointment in Appointment.objects.filter(id__in=appointment_ids, status=Appointment.STATUS_PAYMENT_FAILED):
+                appointment.status = Appointment.STATUS_CONFIRMED
+                try:
+                    with transaction.atomic():
+                        appointment.save()
+                except SlotFull:
+                    without_seat.add(appointment.id)
+
+            # As in confirm_transaction: no payout or revenue for a payment
+            # that lost its seat, only a refund to make
+            refunds = [record for record in succeeded if record.appointment_id in without_seat]
+            if refunds:
+                PaystackService.require_refund(refunds)
+                succeeded = [record for record in succeeded if record.appointment_id not in without_seat]
+                outcome['refund_required'] += len(refunds)
+            payouts = [PaystackService.build_payout(record) for record in succeeded]
+            Payout.objects.bulk_create(payouts, batch_size=BATCH_SIZE, ignore_conflicts=True)
+            record_revenue(payouts)
+
+        if failed:
+            fail_appointments(Appointment.objects.filter(id__in=[record.appointment_id for record in failed]))
+
+    outcome['succeeded'] += len(succeeded)
+    outcome['failed'] += len(failed)
+    outcome['seen'] += len(remote)
+    return outcome
+
+
+def reconcile_transactions(date_from, date_to, per_page=100):
+    """
+    Page through Paystack's transactions for a window and fix local rows
+    stuck in pending. Memory stays bounded by one page whatever the window.
+    """
+    service = PaystackService()
+    totals = Counter()
+    for page in service.list_transactions(date_from, date_to, per_page=per_page):
+        totals.update(reconcile_page(page))
+    return totals
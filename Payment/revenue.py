@@ -0,0 +1,85 @@
+from datetime import datetime, time, timedelta
+
+from django.db import transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import BusinessDailyRevenue, Payout
+
+BATCH_SIZE = 500
+
+
+def _rollup(payouts):
+    """Sum unsaved rollup rows per (business, local day of the payout)"""
+    rows = {}
+    for payout in payouts:
+        key = (payout.business_id, timezone.localdate(payout.created_at))
+        row = rows.get(key)
+        if row is None:
+            row = rows[key] = BusinessDailyRevenue(business_id=key[0], date=key[1])
+        row.gross += payout.amount + payout.platform_fee
+        row.platform_fee += payout.platform_fee
+        row.net += payout.amount
+        row.transaction_count += 1
+    return rows
+
+
+def record_revenue(payouts):
+    """
+    Add newly created payouts to the daily rollups. Call it in the
+    transaction that created them, and only with payouts that transaction
+    created, so each successful transaction is counted exactly once.
+    """
+    rows = _rollup(payouts)
+    if not rows:
+        return
+    BusinessDailyRevenue.objects.bulk_create(
+        [BusinessDailyRevenue(business_id=business_id, date=day) for business_id, day in rows],
+        ignore_conflicts=True,
+    )
+    # Sorted so concurrent writers lock the rows in the same order
+    for key in sorted(rows):
+        row = rows[key]
+        BusinessDailyRevenue.objects.filter(business_id=row.business_id, date=row.date).update(
+            gross=F('gross') + row.gross,
+            platform_fee=F('platform_fee') + row.platform_fee,
+            net=F('net') + row.net,
+            transaction_count=F('transaction_count') + row.transaction_count,
+        )
+
+
+def rebuild_revenue(date_from, date_to):
+    """
+    Recompute the rollups of local days date_from..date_to (inclusive) from
+    the payouts, with one grouped query. Returns the number of rows written.
+    """
+    tz = timezone.get_default_timezone()
+    start = timezone.make_aware(datetime.combine(date_from, time.min), tz)
+    end = timezone.make_aware(datetime.combine(date_to + timedelta(days=1), time.min), tz)
+    totals = (
+        Payout.objects.filter(created_at__gte=start, created_at__lt=end)
+        .annotate(day=TruncDate('created_at', tzinfo=tz))
+        .values('business_id', 'day')
+        .annotate(
+            fee_total=Sum('platform_fee'),
+            net_total=Sum('amount'),
+            count=Count('id'),
+        )
+        .order_by()
+    )
+    with transaction.atomic():
+        BusinessDailyRevenue.objects.filter(date__range=(date_from, date_to)).delete()
+        rows = [
+            BusinessDailyRevenue(
+                business_id=total['business_id'],
+                date=total['day'],
+                gross=total['net_total'] + total['fee_total'],
+                platform_fee=total['fee_total'],
+                net=total['net_total'],
+                transaction_count=total['count'],
+            )
+            for total in totals.iterator(chunk_size=BATCH_SIZE)
+        ]
+        BusinessDailyRevenue.objects.bulk_create(rows, batch_size=BATCH_SIZE)
+    return len(rows)
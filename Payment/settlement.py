@@ -0,0 +1,184 @@
+import logging
+import uuid
+from collections import Counter
+from datetime import timedelta
+from itertools import groupby
+
+import requests
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .circuit_breaker import CircuitOpen
+from .models import Payout
+from .payment_service import PaystackService
+
+logger = logging.getLogger(__name__)
+
+# Paystack accepts at most this many transfers per bulk request
+MAX_BULK_TRANSFERS = 100
+BATCH_SIZE = 1000
+# A sent payout with no final status after this long is checked with Paystack
+DEFAULT_TRANSFER_CHECK_AFTER = timedelta(hours=1)
+# Final statuses of a transfer as reported by transfer/verify
+TRANSFER_STATUSES = {
+    'success': Payout.STATUS_PROCESSED,
+    'failed': Payout.STATUS_FAILED,
+    'reversed': Payout.STATUS_FAILED,
+}
+
+
+def transfer_reference():
+    return f"po-{uuid.uuid4().hex}"
+
+
+def transfer_check_cutoff(now=None):
+    return (now or timezone.now()) - getattr(settings, 'PAYOUT_TRANSFER_CHECK_AFTER', DEFAULT_TRANSFER_CHECK_AFTER)
+
+
+def claim_payouts(limit=BATCH_SIZE):
+    """
+    Give pending payouts without a transfer yet a reference and return them,
+    grouped by currency. The references are committed before anything is
+    sent, so another worker skips these rows and a lost response cannot
+    lead to paying twice.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        payouts = list(
+            Payout.objects.select_for_update(of=('self',), skip_locked=True)
+            .select_related('business', 'transaction')
+            .filter(
+                status=Payout.STATUS_PENDING,
+                paystack_transfer_reference__isnull=True,
+                business__paystack_recipient_code__gt='',
+            )
+            .order_by('currency', 'id')[:limit]
+        )
+        for payout in payouts:
+            payout.paystack_transfer_reference = transfer_reference()
+            # When it was sent, for the check of transfers that never settle
+            payout.updated_at = now
+        Payout.objects.bulk_update(payouts, ['paystack_transfer_reference', 'updated_at'], batch_size=BATCH_SIZE)
+    return payouts
+
+
+def claim_stale_transfers(limit=BATCH_SIZE):
+    """
+    Pending payouts sent longer than the check interval ago, e.g. by a bulk
+    call that got no answer and whose webhooks never came. updated_at is
+    bumped as they are claimed so other workers leave them alone, and a
+    payout still in flight is looked at again one interval later.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        payouts = list(
+            Payout.objects.select_for_update(of=('self',), skip_locked=True)
+            .select_related('business', 'transaction')
+            .filter(
+                status=Payout.STATUS_PENDING,
+                paystack_transfer_reference__isnull=False,
+                updated_at__lt=transfer_check_cutoff(now),
+            )
+            .order_by('currency', 'id')[:limit]
+        )
+        Payout.objects.filter(id__in=[payout.id for payout in payouts]).update(updated_at=now)
+    return payouts
+
+
+def release_references(chunk):
+    """Free payouts that were never sent so the next run claims them again"""
+    Payout.objects.filter(id__in=[payout.id for payout in chunk]).update(paystack_transfer_reference=None)
+
+
+def submit_chunk(service, currency, chunk, outcome):
+    try:
+        response = service.bulk_transfer(currency, chunk)
+    except CircuitOpen:
+        # Not sent at all while Paystack is failing
+        release_references(chunk)
+        outcome['deferred'] += len(chunk)
+        return
+    except requests.exceptions.RequestException:
+        # Paystack may have queued them; the webhooks or check_transfer settle these
+        logger.exception("Bulk transfer of %d payout(s) got no answer", len(chunk))
+        outcome['unknown'] += len(chunk)
+        return
+    if response.status_code == 200 and response.json().get('status'):
+        outcome['submitted'] += len(chunk)
+        return
+    # Rejected outright: free the payouts for the next run
+    logger.error("Bulk transfer rejected: %s", response.text[:200])
+    release_references(chunk)
+    outcome['rejected'] += len(chunk)
+
+
+def submit(service, payouts, outcome):
+    """Send claimed payouts, one currency and up to MAX_BULK_TRANSFERS per call"""
+    for currency, group in groupby(payouts, key=lambda payout: payout.currency):
+        group = list(group)
+        for start in range(0, len(group), MAX_BULK_TRANSFERS):
+            submit_chunk(service, currency, group[start:start + MAX_BULK_TRANSFERS], outcome)
+
+
+def check_transfer(service, payout, outcome):
+    """
+    Apply Paystack's final status to a stale payout. Returns True when
+    Paystack has no transfer under its reference, so it was never queued.
+    """
+    response = service.verify_transfer(payout.paystack_transfer_reference)
+    if response.status_code == 404:
+        return True
+    if response.status_code != 200:
+        return False
+    status = TRANSFER_STATUSES.get((response.json().get('data') or {}).get('status'))
+    if status is not None:
+        Payout.objects.filter(id=payout.id, status=Payout.STATUS_PENDING).update(
+            status=status,
+            updated_at=timezone.now(),
+        )
+        outcome['confirmed'] += 1
+    return False
+
+
+def retry_stale_transfers(service, outcome, batch_size=BATCH_SIZE):
+    """
+    Check stale payouts with transfer/verify and send the ones Paystack
+    never queued again under the same reference, which Paystack accepts at
+    most once.
+    """
+    while True:
+        payouts = claim_stale_transfers(batch_size)
+        missing = []
+        for payout in payouts:
+            try:
+                if check_transfer(service, payout, outcome):
+                    missing.append(payout)
+            except CircuitOpen:
+                # The rest are checked again one interval later
+                return
+            except requests.exceptions.RequestException:
+                logger.warning("Transfer %s could not be checked", payout.paystack_transfer_reference, exc_info=True)
+        submit(service, missing, outcome)
+        if len(payouts) < batch_size:
+            return
+
+
+def settle_payouts(batch_size=BATCH_SIZE):
+    """
+    Send every pending payout through Paystack's bulk transfer API, up to
+    MAX_BULK_TRANSFERS per call and one currency per call. Final statuses
+    arrive through the transfer webhooks; payouts sent earlier that never
+    got one are checked first. Returns a Counter of outcomes.
+    """
+    service = PaystackService()
+    outcome = Counter()
+    retry_stale_transfers(service, outcome, batch_size)
+    while True:
+        payouts = claim_payouts(batch_size)
+        if not payouts:
+            return outcome
+        submit(service, payouts, outcome)
+        # Released payouts are claimable again; leave them for the next run
+        if len(payouts) < batch_size or outcome['rejected'] or outcome['deferred']:
+            return outcome
@@ -1,3 +1,156 @@
-from django.test import TestCase
+import gc
+from unittest import mock
 
-# Create your tests here.
+from django.db import IntegrityError, transaction
+from django.test import TestCase, TransactionTestCase
+from django.urls import reverse
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from Appointments.models import Appointment
+from Appointments.tests import make_service, make_timeslot, make_user, run_concurrently, stub_outside_services
+from Notifications.models import Notification
+from .async_service import AsyncPaystackService
+from .models import PaystackEvent, Payout, Transaction
+from .payment_service import PaystackService
+from .reconciliation import reconcile_page
+from .webhooks import store_event
+
+CHARGE_SUCCESS = {'event': 'charge.success', 'data': {'id': 1234, 'reference': 'ref-1', 'amount': 5000}}
+
+
+def make_pending_transaction(reference='ref-1'):
+    """A payment-pending booking and its pending transaction"""
+    service, pricing = make_service()
+    appointment = Appointment.objects.create(
+        user=make_user('customer@example.com'), timeslot=make_timeslot(service), service=service, pricing=pricing,
+    )
+    return Transaction.objects.create(appointment=appointment, amount=pricing.price, paystack_reference=reference)
+
+
+class StoreEventTests(TestCase):
+    def test_redelivered_event_is_stored_once(self):
+        store_event(CHARGE_SUCCESS)
+        store_event(CHARGE_SUCCESS)
+
+        event = PaystackEvent.objects.get()
+        self.assertEqual(event.event_id, 'charge.success:1234')
+        self.assertEqual(event.status, PaystackEvent.STATUS_PENDING)
+
+    def test_events_about_different_objects_are_kept_apart(self):
+        store_event(CHARGE_SUCCESS)
+        store_event({'event': 'charge.success', 'data': {'id': 5678, 'reference': 'ref-2'}})
+        store_event({'event': 'transfer.success', 'data': {'id': 1234, 'reference': 'ref-1'}})
+
+        self.assertEqual(PaystackEvent.objects.count(), 3)
+
+
+class ConfirmTransactionTests(TestCase):
+    def setUp(self):
+        stub_outside_services(self)
+
+    def test_confirms_the_appointment_and_creates_one_payout(self):
+        pending = make_pending_transaction()
+
+        confirmed = PaystackService().confirm_transaction('ref-1')
+
+        self.assertEqual(confirmed.pk, pending.pk)
+        self.assertEqual(Transaction.objects.get(pk=pending.pk).status, Transaction.STATUS_SUCCESSFUL)
+        self.assertEqual(Appointment.objects.get(pk=pending.appointment_id).status, Appointment.STATUS_CONFIRMED)
+        self.assertEqual(Payout.objects.filter(transaction=pending).count(), 1)
+
+    def test_second_confirmation_does_nothing(self):
+        make_pending_transaction()
+        PaystackService().confirm_transaction('ref-1')
+
+        self.assertIsNone(PaystackService().confirm_transaction('ref-1'))
+        self.assertEqual(Payout.objects.count(), 1)
+
+    def test_payment_for_a_rebooked_seat_requires_a_refund(self):
+        pending = make_pending_transaction()
+        appointment = pending.appointment
+        # The hold lapsed and someone else took the only seat
+        appointment.status = Appointment.STATUS_PAYMENT_FAILED
+        appointment.save()
+        Appointment.objects.create(
+            user=make_user('other@example.com'), timeslot=appointment.timeslot, service=appointment.service,
+            pricing=appointment.pricing,
+        )
+
+        with self.assertLogs('Payment.payment_service', 'WARNING'):
+            PaystackService().confirm_transaction('ref-1')
+
+        self.assertEqual(Transaction.objects.get(pk=pending.pk).status, Transaction.STATUS_REFUND_REQUIRED)
+        self.assertEqual(Appointment.objects.get(pk=appointment.pk).status, Appointment.STATUS_PAYMENT_FAILED)
+        self.assertFalse(Payout.objects.exists())
+
+    def test_one_payout_per_transaction(self):
+        pending = make_pending_transaction()
+        PaystackService().confirm_transaction('ref-1')
+
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Payout.objects.create(business=pending.appointment.service.business, transaction=pending, amount=1, platform_fee=0)
+
+
+class ReconcilePageTests(TestCase):
+    def setUp(self):
+        stub_outside_services(self)
+
+    def test_confirmed_appointments_get_their_update_email(self):
+        pending = make_pending_transaction()
+
+        outcome = reconcile_page([{'reference': 'ref-1', 'status': 'success', 'amount': 5000}])
+
+        self.assertEqual(outcome['succeeded'], 1)
+        appointment = Appointment.objects.get(pk=pending.appointment_id)
+        self.assertEqual(appointment.status, Appointment.STATUS_CONFIRMED)
+        notification = Notification.objects.get(appointment=appointment, notification_type='appointment_updated')
+        self.assertEqual(notification.context['service'], appointment.service.name)
+        self.assertEqual(Payout.objects.filter(transaction=pending).count(), 1)
+
+
+class ConcurrentPaymentTests(TransactionTestCase):
+    def setUp(self):
+        stub_outside_services(self)
+
+    def test_concurrent_deliveries_of_an_event_store_one_row(self):
+        run_concurrently(8, lambda index: store_event(CHARGE_SUCCESS))
+
+        self.assertEqual(PaystackEvent.objects.filter(event_id='charge.success:1234').count(), 1)
+
+    def test_racing_confirmations_confirm_once(self):
+        pending = make_pending_transaction()
+
+        results = run_concurrently(8, lambda index: PaystackService().confirm_transaction('ref-1'))
+
+        confirmed = [result for result in results if isinstance(result, Transaction)]
+        self.assertEqual(len(confirmed), 1, results)
+        self.assertEqual(results.count(None), 7, results)
+        self.assertEqual(Payout.objects.filter(transaction=pending).count(), 1)
+        self.assertEqual(Appointment.objects.get(pk=pending.appointment_id).status, Appointment.STATUS_CONFIRMED)
+
+
+class AsyncVerifyPaymentTests(TransactionTestCase):
+    """verify_payment_async, whose database work runs on other threads"""
+
+    def setUp(self):
+        stub_outside_services(self)
+        self.pending = make_pending_transaction()
+        self.url = reverse('verify_payment_async', args=[self.pending.appointment_id])
+        token = RefreshToken.for_user(self.pending.appointment.user).access_token
+        self.headers = {'Authorization': f'Bearer {token}'}
+        # The pool threads that ran the view exit with the test's event loop,
+        # but their connections are only closed once collected
+        self.addCleanup(gc.collect)
+
+    async def test_requires_authentication(self):
+        response = await self.async_client.get(self.url, {'reference': 'ref-1'})
+
+        self.assertEqual(response.status_code, 401)
+
+    async def test_unpaid_reference_fails_the_appointment(self):
+        with mock.patch.object(AsyncPaystackService, 'verify_payment', return_value=False):
+            response = await self.async_client.get(self.url, {'reference': 'ref-1'}, headers=self.headers)
+
+        self.assertEqual(response.status_code, 400)
+        appointment = await Appointment.objects.aget(pk=self.pending.appointment_id)
+        self.assertEqual(appointment.status, Appointment.STATUS_PAYMENT_FAILED)
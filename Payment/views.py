@@ -1,12 +1,21 @@
 from django.shortcuts import render
 from rest_framework import status
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, permission_classes, authentication_classes
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAuthenticated, AllowAny
 from django.shortcuts import get_object_or_404
 from Appointments.models import Appointment
-from .payment_service import PaystackService
-from .models import Transaction
+from .payment_service import PaystackService, PaymentUnavailable
+from .models import BusinessDailyRevenue, Transaction
+from .webhooks import signature_is_valid, store_event
+from .async_service import AsyncPaystackService
+from django.http import JsonResponse
+from django.views.decorators.http import require_GET
+from easybook.async_views import async_api_view, run_sync
+import json
+from datetime import datetime, timedelta
+from django.db.models import Sum
+from django.utils import timezone
 
 # Create your views here.
 
@@ -96,12 +105,23 @@ def initialize_payment(request, appointment_id):
             amount=appointment.pricing.price
         )
         return Response({"payment_url": payment_url})
+    except PaymentUnavailable:
+        return Response(
+            {"error": "Payments are temporarily unavailable, please try again shortly"},
+            status=status.HTTP_503_SERVICE_UNAVAILABLE
+        )
     except Exception as e:
         return Response(
             {"error": str(e)},
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
 
+REFUND_REQUIRED_RESPONSE = {
+    "status": "refund_required",
+    "error": "The payment arrived after the booking expired and the timeslot was taken; it will be refunded",
+}
+
+
 @api_view(['GET'])
 def verify_payment(request, appointment_id):
     """Verify payment status after Paystack redirect"""
@@ -117,10 +137,10 @@ def verify_payment(request, appointment_id):
         paystack_service = PaystackService()
         
         if paystack_service.verify_payment(reference):
-            # Update appointment status to confirmed
-            appointment.status = Appointment.STATUS_CONFIRMED
-            appointment.save()
+            # The appointment was confirmed along with its transaction
             return Response({"status": "success"})
+        if Transaction.objects.filter(paystack_reference=reference, status=Transaction.STATUS_REFUND_REQUIRED).exists():
+            return Response(REFUND_REQUIRED_RESPONSE, status=status.HTTP_409_CONFLICT)
         
         # If payment verification fails, update appointment status
         appointment.status = Appointment.STATUS_PAYMENT_FAILED
@@ -134,3 +154,106 @@ def verify_payment(request, appointment_id):
             {"error": str(e)},
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
+
+
+# Longest range one revenue request may cover
+MAX_REVENUE_DAYS = 366
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def business_revenue(request):
+    """
+    Daily earnings of the signed-in business between ?from= and ?to=
+    (YYYY-MM-DD, inclusive; the last 30 days by default), read from the
+    daily rollup table
+    """
+    if not request.user.is_business:
+        return Response(
+            {"error": "Only business users can view revenue"},
+            status=status.HTTP_403_FORBIDDEN
+        )
+
+    today = timezone.localdate()
+    try:
+        date_to = datetime.strptime(request.query_params['to'], '%Y-%m-%d').date() if 'to' in request.query_params else today
+        date_from = (
+            datetime.strptime(request.query_params['from'], '%Y-%m-%d').date()
+            if 'from' in request.query_params else date_to - timedelta(days=29)
+        )
+    except ValueError:
+        return Response({"error": "Dates must be given as YYYY-MM-DD"}, status=status.HTTP_400_BAD_REQUEST)
+    if date_from > date_to or (date_to - date_from).days >= MAX_REVENUE_DAYS:
+        return Response(
+            {"error": f"'from' must not be after 'to' and the range is limited to {MAX_REVENUE_DAYS} days"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    rows = BusinessDailyRevenue.objects.filter(business=request.user, date__range=(date_from, date_to))
+    days = list(rows.order_by('date').values('date', 'gross', 'platform_fee', 'net', 'transaction_count'))
+    totals = rows.aggregate(
+        gross=Sum('gross'),
+        platform_fee=Sum('platform_fee'),
+        net=Sum('net'),
+        transaction_count=Sum('transaction_count'),
+    )
+    return Response({
+        "from": date_from,
+        "to": date_to,
+        "days": days,
+        "totals": {key: value or 0 for key, value in totals.items()},
+    })
+
+
+@api_view(['POST'])
+@authentication_classes([])
+@permission_classes([AllowAny])
+def paystack_webhook(request):
+    """
+    Receive Paystack events. The signature is checked against the raw body
+    and the event is stored for the process_paystack_events worker, so
+    Paystack gets its 200 without waiting on any processing.
+    """
+    body = request.body
+    if not signature_is_valid(body, request.headers.get('x-paystack-signature')):
+        return Response({"error": "Invalid signature"}, status=status.HTTP_401_UNAUTHORIZED)
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        return Response({"error": "Invalid payload"}, status=status.HTTP_400_BAD_REQUEST)
+    store_event(payload)
+    return Response(status=status.HTTP_200_OK)
+
+
+def _record_failed_verification(appointment, reference):
+    """
+    Mark the appointment of an unverified payment failed, unless the payment
+    only came too late to keep its seat. Returns whether it was marked.
+    """
+    if Transaction.objects.filter(paystack_reference=reference, status=Transaction.STATUS_REFUND_REQUIRED).exists():
+        return False
+    appointment.status = Appointment.STATUS_PAYMENT_FAILED
+    appointment.save()
+    return True
+
+
+@require_GET
+@async_api_view
+async def verify_payment_async(request, appointment_id):
+    """verify_payment for ASGI; the Paystack round trip does not hold a thread"""
+    reference = request.query_params.get('reference')
+    if not reference:
+        return JsonResponse({"error": "No reference provided"}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        appointment = await run_sync(Appointment.objects.get)(id=appointment_id)
+    except Appointment.DoesNotExist:
+        return JsonResponse({"detail": "Not found."}, status=status.HTTP_404_NOT_FOUND)
+    try:
+        if await AsyncPaystackService().verify_payment(reference):
+            return JsonResponse({"status": "success"})
+        if not await run_sync(_record_failed_verification)(appointment, reference):
+            return JsonResponse(REFUND_REQUIRED_RESPONSE, status=status.HTTP_409_CONFLICT)
+        return JsonResponse({"status": "failed"}, status=status.HTTP_400_BAD_REQUEST)
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
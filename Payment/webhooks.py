@@ -0,0 +1,134 @@
+import hashlib
+import hmac
+import logging
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import PaystackEvent, Payout, Transaction
+from .payment_service import PaystackService, invalidate_subaccount
+
+logger = logging.getLogger(__name__)
+
+# Failed events are retried on later runs until they have had this many attempts
+MAX_ATTEMPTS = 5
+BATCH_SIZE = 100
+
+
+def signature_is_valid(body, signature):
+    """Check the x-paystack-signature header: HMAC-SHA512 of the raw body with the secret key"""
+    if not signature:
+        return False
+    expected = hmac.new(settings.PAYSTACK_SECRET_KEY.encode(), body, hashlib.sha512).hexdigest()
+    return hmac.compare_digest(expected, signature)
+
+
+def event_id(payload):
+    """Stable id of an event; Paystack sends no event id, so the event name and object id make one"""
+    data = payload.get('data') or {}
+    return f"{payload.get('event')}:{data.get('id') or data.get('reference')}"
+
+
+def event_subaccount_code(payload):
+    """
+    Subaccount whose status an event reports, or None. Only subaccount.*
+    events say anything about the subaccount itself; split charges also
+    carry a subaccount but invalidating on each of them would keep the
+    cache of every busy business cold.
+    """
+    if not str(payload.get('event', '')).startswith('subaccount.'):
+        return None
+    data = payload.get('data') or {}
+    return data.get('subaccount_code')
+
+
+def store_event(payload):
+    """Save a verified event unless it was already received; a single INSERT ... ON CONFLICT DO NOTHING"""
+    PaystackEvent.objects.bulk_create(
+        [PaystackEvent(event_id=event_id(payload), event=payload.get('event', ''), payload=payload)],
+        ignore_conflicts=True,
+    )
+    # Paystack told us something about this subaccount; verify it afresh
+    invalidate_subaccount(event_subaccount_code(payload))
+
+
+class IgnoredEvent(Exception):
+    """An event that needs no action, e.g. for a reference this app did not create"""
+
+
+def handle_charge_success(data):
+    transaction_record = Transaction.objects.filter(paystack_reference=data.get('reference')).first()
+    if transaction_record is None:
+        raise IgnoredEvent(f"Unknown transaction reference {data.get('reference')}")
+    if transaction_record.status != Transaction.STATUS_PENDING:
+        return
+    if data.get('amount') != int(transaction_record.amount * 100):
+        raise ValueError(f"Charged amount {data.get('amount')} does not match transaction amount {transaction_record.amount}")
+    # Paid after the hold lapsed and the slot was rebooked: marked refund required
+    PaystackService().confirm_transaction(transaction_record.paystack_reference)
+
+
+def handle_transfer(status):
+    def handler(data):
+        updated = Payout.objects.filter(paystack_transfer_reference=data.get('reference')).update(
+            status=status,
+            updated_at=timezone.now(),
+        )
+        if not updated:
+            raise IgnoredEvent(f"Unknown transfer reference {data.get('reference')}")
+    return handler
+
+
+HANDLERS = {
+    'charge.success': handle_charge_success,
+    'transfer.success': handle_transfer(Payout.STATUS_PROCESSED),
+    'transfer.failed': handle_transfer(Payout.STATUS_FAILED),
+    'transfer.reversed': handle_transfer(Payout.STATUS_FAILED),
+}
+
+
+def process_event(event):
+    """Apply one claimed event; a failure is recorded on the event and retried later"""
+    event.attempts += 1
+    handler = HANDLERS.get(event.event)
+    try:
+        if handler is not None:
+            with transaction.atomic():
+                handler(event.payload.get('data') or {})
+        event.status = PaystackEvent.STATUS_PROCESSED
+        event.last_error = ''
+    except IgnoredEvent as exc:
+        event.status = PaystackEvent.STATUS_PROCESSED
+        event.last_error = str(exc)
+        logger.warning("Paystack event %s ignored: %s", event.event_id, exc)
+    except Exception as exc:
+        logger.exception("Paystack event %s failed", event.event_id)
+        event.last_error = str(exc)
+        if event.attempts >= MAX_ATTEMPTS:
+            event.status = PaystackEvent.STATUS_FAILED
+    event.processed_at = timezone.now()
+    event.save(update_fields=['status', 'attempts', 'last_error', 'processed_at'])
+
+
+def process_pending_events(batch_size=BATCH_SIZE):
+    """
+    Work through pending events in arrival order, a batch at a time. Rows are
+    claimed with SKIP LOCKED so several workers can run side by side. Each
+    pending event is tried once per run. Returns the number of events handled.
+    """
+    handled = 0
+    last_id = 0
+    while True:
+        with transaction.atomic():
+            events = list(
+                PaystackEvent.objects.select_for_update(skip_locked=True)
+                .filter(status=PaystackEvent.STATUS_PENDING, id__gt=last_id)
+                .order_by('id')[:batch_size]
+            )
+            for event in events:
+                process_event(event)
+        if not events:
+            return handled
+        handled += len(events)
+        last_id = events[-1].id
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:28
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Services', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='service',
+            index=models.Index(fields=['created_at', 'id'], name='service_created_idx'),
+        ),
+    ]
@@ -17,6 +17,11 @@ class Service(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='service_created_idx'),
+        ]
+
     def __str__(self):
         return self.name
 
@@ -8,7 +8,7 @@ from .models import Service, ServiceCategory, Pricing
 from .serializers import ServiceSerializer, ServiceCategorySerializer, PricingSerializer
 
 class ServiceViewSet(viewsets.ModelViewSet):
-    queryset = Service.objects.all()
+    queryset = Service.objects.select_related('category').prefetch_related('pricing_options')
     serializer_class = ServiceSerializer
     permission_classes = [IsAuthenticated]
 
@@ -17,6 +17,7 @@ class ServiceViewSet(viewsets.ModelViewSet):
     filterset_fields = ['category', 'business']  # Allow filtering by category and business
     ordering_fields = ['created_at', 'name']     # Allow ordering by creation date and name
     search_fields = ['name', 'description']        # Allow searching by name and description
+    ordering = ['-created_at', '-id']              # Default ordering, also used as the pagination cursor
 
     def perform_create(self, serializer):
         serializer.save(business=self.request.user)
@@ -25,11 +26,13 @@ class ServiceCategoryListCreateView(generics.ListCreateAPIView):
     queryset = ServiceCategory.objects.all()
     serializer_class = ServiceCategorySerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
+    cursor_ordering = ('name',)
 
 class PricingListCreateView(generics.ListCreateAPIView):
     queryset = Pricing.objects.all()
     serializer_class = PricingSerializer
     permission_classes = [IsAuthenticated]
+    cursor_ordering = ('id',)
 
     def perform_create(self, serializer):
         service = serializer.validated_data.get('service')
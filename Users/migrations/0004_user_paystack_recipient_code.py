@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_user_calendar_token'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='paystack_recipient_code',
+            field=models.CharField(blank=True, max_length=100, null=True),
+        ),
+    ]
@@ -39,6 +39,8 @@ class User(AbstractUser):
     paystack_subaccount_id = models.CharField(max_length=100, null=True, blank=True)
     paystack_subaccount_code = models.CharField(max_length=100, null=True, blank=True)
     paystack_subaccount_active = models.BooleanField(default=False)
+    # Transfer recipient that payouts not covered by the split are sent to
+    paystack_recipient_code = models.CharField(max_length=100, null=True, blank=True)
     mobile_money_network = models.CharField(
         max_length=20,
         null=True,
@@ -56,6 +58,8 @@ class User(AbstractUser):
     business_address = models.TextField(null=True, blank=True)
     business_phone = models.CharField(max_length=20, null=True, blank=True)
     business_email = models.EmailField(null=True, blank=True)
+    # Secret in the URL of the business's iCalendar feed
+    calendar_token = models.CharField(max_length=64, unique=True, null=True, blank=True, editable=False)
 
     USERNAME_FIELD = "email"  # Use email instead of username for authentication
     REQUIRED_FIELDS = ["first_name", "last_name"]  # Make first and last name required
@@ -0,0 +1,60 @@
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.exceptions import APIException, NotAuthenticated, PermissionDenied
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+
+def run_sync(func):
+    """
+    sync_to_async for the database work of async views. It runs on the event
+    loop's shared thread pool rather than in a thread created for the
+    request, so each pool thread keeps its persistent connection
+    (CONN_MAX_AGE) instead of a connection being opened per request.
+    """
+    def call(*args, **kwargs):
+        # What request_started does for a sync request's connection
+        close_old_connections()
+        return func(*args, **kwargs)
+    return sync_to_async(call, thread_sensitive=False)
+
+
+def api_request(request):
+    """
+    Wrap a Django request as APIView does, with DRF's configured parsers and
+    authentication classes, and check the default permission classes.
+    Raises the APIException DRF would answer with.
+    """
+    drf_request = Request(
+        request,
+        parsers=[parser() for parser in api_settings.DEFAULT_PARSER_CLASSES],
+        authenticators=[authenticator() for authenticator in api_settings.DEFAULT_AUTHENTICATION_CLASSES],
+    )
+    for permission in [permission() for permission in api_settings.DEFAULT_PERMISSION_CLASSES]:
+        if not permission.has_permission(drf_request, None):
+            if drf_request.authenticators and not drf_request.successful_authenticator:
+                raise NotAuthenticated()
+            raise PermissionDenied(getattr(permission, 'message', None))
+    return drf_request
+
+
+def async_api_view(view):
+    """
+    Serve an async view behind DRF's authentication and permissions. The
+    view is called with the DRF request. Like APIView it is exempt from
+    CSRF middleware; SessionAuthentication enforces CSRF when configured.
+    """
+    @csrf_exempt
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        try:
+            drf_request = await run_sync(api_request)(request)
+        except APIException as exc:
+            detail = exc.detail if isinstance(exc.detail, (list, dict)) else {"detail": exc.detail}
+            return JsonResponse(detail, status=exc.status_code, safe=False)
+        return await view(drf_request, *args, **kwargs)
+    return wrapper
@@ -0,0 +1,22 @@
+from rest_framework.pagination import CursorPagination
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Cursor (keyset) pagination used by every list endpoint.
+
+    Pages are fetched with a WHERE on the ordering column instead of an
+    OFFSET, so deep pages cost the same as the first one. Views that list
+    models without a created_at column set `cursor_ordering` to another
+    stable, indexed ordering.
+    """
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+    ordering = ('-created_at', '-id')
+
+    def get_ordering(self, request, queryset, view):
+        ordering = getattr(view, 'cursor_ordering', None)
+        if ordering:
+            return ordering
+        return super().get_ordering(request, queryset, view)
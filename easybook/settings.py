@@ -91,10 +91,28 @@ DATABASES = {
         'NAME': 'easybook',
         'USER': 'postgres',
         'PASSWORD': '7624',
-        'HOST': 'localhost'
+        'HOST': 'localhost',
+        # Keep connections between requests instead of opening one per request
+        'CONN_MAX_AGE': 60,
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+# Cache shared by every worker when REDIS_URL is set; per-process otherwise
+if os.getenv('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -145,6 +163,7 @@ REST_FRAMEWORK = {
      'DEFAULT_PERMISSION_CLASSES': (
          'rest_framework.permissions.IsAuthenticated',  # Restricts access by default
     ),
+    'DEFAULT_PAGINATION_CLASS': 'easybook.pagination.KeysetPagination',
 }
 
 from datetime import timedelta
@@ -157,6 +176,42 @@ SIMPLE_JWT = {
 }
 
 AUTH_USER_MODEL = 'users.User'
+
+# How long a payment-pending appointment holds its timeslot before the
+# expire_holds sweeper marks it as payment failed
+APPOINTMENT_HOLD_TTL = timedelta(minutes=15)
+
+# How long before an appointment its reminder email is sent
+REMINDER_LEAD_TIME = timedelta(hours=24)
+
+# Sent, failed and cancelled notifications older than NOTIFICATION_RETENTION
+# are moved to the archive table by archive_notifications, which deletes
+# archived rows older than NOTIFICATION_ARCHIVE_RETENTION
+NOTIFICATION_RETENTION = timedelta(days=90)
+NOTIFICATION_ARCHIVE_RETENTION = timedelta(days=730)
+
+# Paystack HTTP client: (connect, read) timeouts in seconds, retries for
+# idempotent calls and keep-alive connections kept per worker process
+PAYSTACK_BASE_URL = os.getenv('PAYSTACK_BASE_URL', 'https://api.paystack.co')
+PAYSTACK_TIMEOUT = (3.05, 15)
+PAYSTACK_MAX_RETRIES = 2
+PAYSTACK_POOL_SIZE = 10
+# An ASGI worker keeps many more Paystack calls in flight than a thread does
+PAYSTACK_ASYNC_POOL_SIZE = 100
+# Booking waits at most this long for transaction/initialize; a slower
+# Paystack defers the payment link instead of holding the request
+PAYSTACK_INITIALIZE_TIMEOUT = (3.05, 5)
+# Circuit breaker: open for PAYSTACK_BREAKER_OPEN_SECONDS once half the calls
+# in a PAYSTACK_BREAKER_WINDOW-second window (at least PAYSTACK_BREAKER_MIN_CALLS)
+# failed or took PAYSTACK_BREAKER_SLOW_CALL_SECONDS or more. Shared across
+# workers only when REDIS_URL is set.
+PAYSTACK_BREAKER_FAILURE_RATE = 0.5
+PAYSTACK_BREAKER_MIN_CALLS = 10
+PAYSTACK_BREAKER_SLOW_CALL_SECONDS = 5
+PAYSTACK_BREAKER_WINDOW = 60
+PAYSTACK_BREAKER_OPEN_SECONDS = 30
+# How long a subaccount verification is trusted before Paystack is asked again
+PAYSTACK_SUBACCOUNT_TTL = timedelta(minutes=30)
 #AUTH_EMAIL_MODEL = 'Users.User.email'
 
 
@@ -19,8 +19,13 @@ from django.urls import path,include
 from users.views import RegisterView, LoginView, RefreshTokenView, ProfileView
 from django_rest_passwordreset.views import ResetPasswordRequestToken, ResetPasswordConfirm
 from Services.views import ServiceViewSet, ServiceCategoryListCreateView,PricingListCreateView
-from Appointments.views import AvailableTimeSlotListView, AppointmentCreateView, AppointmentDetailView, TimeSlotCreateView
-from Payment.views import setup_subaccount, verify_payment
+from Appointments.views import (
+    AvailableTimeSlotListView, FreeTimeSlotListView, AppointmentCreateView, AppointmentDetailView, TimeSlotCreateView,
+    TimeSlotBulkCreateView, TimeSlotGenerateView, ScheduleRuleListCreateView, ScheduleExceptionListCreateView,
+    WaitlistListCreateView, WaitlistLeaveView, CalendarTokenView, calendar_feed, appointment_create_async,
+    AppointmentViewSet,
+)
+from Payment.views import setup_subaccount, verify_payment, paystack_webhook, verify_payment_async, business_revenue
 
 from rest_framework import routers
 from Notifications.views import NotificationViewSet, UserNotificationPreferenceViewSet
@@ -46,6 +51,10 @@ preference_detail = UserNotificationPreferenceViewSet.as_view({
 
     
 
+appointment_payment_status = AppointmentViewSet.as_view({
+    'get': 'payment_status'
+})
+
 service_list = ServiceViewSet.as_view({
     'get': 'list',
     'post': 'create'
@@ -101,9 +110,21 @@ urlpatterns = [
 
     #Appointments api endpoints
     path('timeslots/get', AvailableTimeSlotListView.as_view(), name='available-timeslots'),
+    path('timeslots/available', FreeTimeSlotListView.as_view(), name='free-timeslots'),
     path('appointments/', AppointmentCreateView.as_view(), name='appointment-create'),
     path('appointments/<uuid:pk>/', AppointmentDetailView.as_view(), name='appointment-detail'),
+    path('appointments/<uuid:pk>/payment/', appointment_payment_status, name='appointment-payment-status'),
+    # Async variants for ASGI deployments
+    path('async/appointments/', appointment_create_async, name='appointment-create-async'),
     path('timeslots/create', TimeSlotCreateView.as_view(), name='timeslot-create'),
+    path('waitlist/', WaitlistListCreateView.as_view(), name='waitlist-list-create'),
+    path('waitlist/<int:pk>/', WaitlistLeaveView.as_view(), name='waitlist-leave'),
+    path('timeslots/bulk', TimeSlotBulkCreateView.as_view(), name='timeslot-bulk-create'),
+    path('timeslots/generate', TimeSlotGenerateView.as_view(), name='timeslot-generate'),
+    path('schedule/rules/', ScheduleRuleListCreateView.as_view(), name='schedule-rule-list-create'),
+    path('schedule/exceptions/', ScheduleExceptionListCreateView.as_view(), name='schedule-exception-list-create'),
+    path('calendar/token', CalendarTokenView.as_view(), name='calendar-token'),
+    path('calendar/<str:token>.ics', calendar_feed, name='calendar-feed'),
 
     #Notifications api endpoints
     path('notifications/', notification_list, name='notification-list'),
@@ -113,6 +134,9 @@ urlpatterns = [
     #Payment api endpoints
     path('payment/subaccount/setup/', setup_subaccount, name='setup_subaccount'),
     path('payment/verify/<uuid:appointment_id>/', verify_payment, name='verify_payment'),
+    path('payment/webhook/', paystack_webhook, name='paystack_webhook'),
+    path('payment/revenue/', business_revenue, name='business_revenue'),
+    path('async/payment/verify/<uuid:appointment_id>/', verify_payment_async, name='verify_payment_async'),
 
     # Swagger UI (interactive API documentation)
     path('swagger/', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),